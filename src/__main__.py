@@ -1,5 +1,10 @@
 import os
-import sys
+import json
+import pstats
+import cProfile
+import argparse
+import multiprocessing
+from dataclasses import asdict
 import test_next
 import test_round
 import test_unary
@@ -9,37 +14,355 @@ import test_remainder
 import test_properties
 import test_logb_scaleb_py
 import test_other
+from common import (
+    FORMATS,
+    COMPRESSIONS,
+    OPERAND_CACHE_MAX_SIZE,
+    Chunk,
+    FileReport,
+    OutputOptions,
+    Task,
+    set_output_options,
+    set_operand_cache,
+)
+
+# 'file_name -> Task.key' of the files in the output directory.
+MANIFEST_FILE_NAME = "manifest.json"
+# Files completed in the current run (JSON line per 'Task'), so that the run can be
+# resumed after a crash. Removed when the manifest is written at the end.
+CHECKPOINT_FILE_NAME = "checkpoint.log"
 
 
 def main():
-    output_dir = "output"
+    parser = argparse.ArgumentParser(prog="src")
+    parser.add_argument("output_dir", nargs="?", default="output")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes (default: 1)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="regenerate all files, even the ones that are up to date",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="keep the files completed by the previous (interrupted) run",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="text",
+        help="text lines or fixed size binary records with BID values (default: text)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        default="none",
+        help="compress every output file while it is being written (default: none)",
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help="xz preset (0-9) or gzip level (1-9)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".operand_cache",
+        help="directory for the generated operands (default: .operand_cache)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=OPERAND_CACHE_MAX_SIZE // (1024 * 1024),
+        help="max size of the operand cache in MB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always generate the operands, do not read/write the cache",
+    )
+    parser.add_argument(
+        "--report",
+        metavar="FILE",
+        help="save time (compute/format/write), size and flags of every file as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE_NAME",
+        help="run 'cProfile' when generating the given output file, "
+        "stats are saved in 'FILE_NAME.prof'",
+    )
+    args = parser.parse_args()
+
+    output_dir: str = args.output_dir
+    output_options = OutputOptions(
+        format=args.format,
+        compression=args.compression,
+        compression_level=args.compression_level,
+    )
+    set_output_options(output_options)
+
+    cache_dir: str | None = None if args.no_cache else args.cache_dir
+    cache_size: int = args.cache_size * 1024 * 1024
+    set_operand_cache(cache_dir, cache_size)
+
+    tasks: list[Task] = []
+    tasks.extend(test_next.tasks())
+    tasks.extend(test_round.tasks())
+    tasks.extend(test_unary.tasks())
+    tasks.extend(test_quantum.tasks())
+    tasks.extend(test_compare.tasks())
+    tasks.extend(test_remainder.tasks())
+    tasks.extend(test_properties.tasks())
+    tasks.extend(test_logb_scaleb_py.tasks())
+    tasks.extend(test_other.tasks())
+
+    # Before anything in 'output_dir' is removed.
+    if args.profile and not any(args.profile in t.output_file_names for t in tasks):
+        parser.error(f"unknown output file: {args.profile}")
+
+    # Only the files with changed 'key' are generated again.
+    manifest = {} if args.force else _read_manifest(output_dir)
+
+    if args.resume and not args.force:
+        manifest.update(_read_checkpoint(output_dir))
+    keys: dict[str, str] = {}
+    up_to_date: dict[str, str] = {}
+
+    for t in tasks:
+        key = t.key()
+        is_up_to_date = True
+
+        # Fused files are always generated together.
+        for file_name in t.output_file_names:
+            path = os.path.join(output_dir, file_name)
+            keys[file_name] = key
+
+            if manifest.get(file_name) != key or not os.path.exists(path):
+                is_up_to_date = False
+
+        if is_up_to_date:
+            for file_name in t.output_file_names:
+                up_to_date[file_name] = key
+
+    _clean_dir(output_dir, keep=set(up_to_date))
+    # If we crash then the manifest should contain only the complete files.
+    _write_manifest(output_dir, up_to_date)
+    _clear_checkpoint(output_dir)
+
+    if up_to_date:
+        print(f"Skipping {len(up_to_date)} up to date files")
+
+    tasks = [t for t in tasks if t.output_file_name not in up_to_date]
+    reports = _run_tasks(
+        tasks,
+        output_dir,
+        keys,
+        args.jobs,
+        output_options,
+        cache_dir,
+        cache_size,
+        report=args.report is not None,
+        profile=args.profile,
+    )
+    _write_manifest(output_dir, keys)
+    _clear_checkpoint(output_dir)
+
+    if args.report:
+        _write_report(args.report, reports)
+
+
+def _run_tasks(
+    tasks: list[Task],
+    output_dir: str,
+    keys: dict[str, str],
+    jobs: int,
+    output_options: OutputOptions,
+    cache_dir: str | None,
+    cache_size: int,
+    *,
+    report: bool,
+    profile: str | None,
+) -> list[FileReport]:
+    reports: list[FileReport] = []
+
+    if jobs <= 1:
+        for t in tasks:
+            _print_file_names(t)
+            r = _run_task((t, output_dir, None, report, profile))[2]
+            _write_checkpoint(output_dir, t, keys)
+            if r is not None:
+                reports.extend(r)
+        return reports
+
+    # Every task writes its own files, so the output is the same as in a serial run.
+    # Cartesian product files are split into chunks, one for each worker.
+    work: list[_Work] = []
+
+    for t in tasks:
+        if t.is_chunked:
+            for index in range(jobs):
+                work.append((t, output_dir, Chunk(index, jobs), report, profile))
+        else:
+            work.append((t, output_dir, None, report, profile))
+
+    # 'imap' returns in order, so when we get the last chunk of the file then all
+    # of the previous ones are already done.
+    init_args = (output_options, cache_dir, cache_size)
+
+    with multiprocessing.Pool(jobs, _init_worker, init_args) as pool:
+        chunk_report: list[FileReport] | None = None
+
+        for task, chunk, r in pool.imap(_run_task, work):
+            if chunk is not None:
+                if r is not None and chunk.index != 0:
+                    assert chunk_report is not None
+                    for total, part in zip(chunk_report, r, strict=True):
+                        total.add(part)
+                    r = chunk_report
+
+                chunk_report = r
+
+                if chunk.index != chunk.count - 1:
+                    continue
+
+                task.join_chunks(output_dir, chunk.count)
+
+                if r is not None:
+                    # Size of the whole files, not only the last chunk.
+                    for file_report in r:
+                        path = os.path.join(output_dir, file_report.file_name)
+                        file_report.bytes = os.path.getsize(path)
+
+            _print_file_names(task)
+            _write_checkpoint(output_dir, task, keys)
+
+            if r is not None:
+                reports.extend(r)
+
+    return reports
+
+
+def _print_file_names(task: Task):
+    for name in task.output_file_names:
+        print(name)
 
-    if len(sys.argv) == 2:
-        output_dir = sys.argv[1]
 
-    _clean_dir(output_dir)
-    test_next.write(output_dir)
-    test_round.write(output_dir)
-    test_unary.write(output_dir)
-    test_quantum.write(output_dir)
-    test_compare.write(output_dir)
-    test_remainder.write(output_dir)
-    test_properties.write(output_dir)
-    test_logb_scaleb_py.write(output_dir)
-    test_other.write(output_dir)
+def _init_worker(
+    output_options: OutputOptions,
+    cache_dir: str | None,
+    cache_size: int,
+):
+    set_output_options(output_options)
+    set_operand_cache(cache_dir, cache_size)
 
 
-def _clean_dir(dir: str):
+# task, output_dir, chunk, report, profile
+_Work = tuple[Task, str, Chunk | None, bool, str | None]
+
+
+def _run_task(work: _Work) -> tuple[Task, Chunk | None, list[FileReport] | None]:
+    task, dir, chunk, report, profile = work
+
+    # Chunks do the same thing, so it is enough to profile the 1st one.
+    is_profiled = profile in task.output_file_names
+    if not is_profiled or (chunk is not None and chunk.index != 0):
+        return task, chunk, task.run(dir, chunk, report=report)
+
+    profiler = cProfile.Profile()
+    r = profiler.runcall(task.run, dir, chunk, report=report)
+
+    profiler.dump_stats(profile + ".prof")
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
+
+    return task, chunk, r
+
+
+def _clean_dir(dir: str, keep: set[str]):
     os.makedirs(dir, exist_ok=True)
 
     for name in os.listdir(dir):
-        path = os.path.join(dir, name)
-        os.unlink(path)
+        if name not in keep and name not in (MANIFEST_FILE_NAME, CHECKPOINT_FILE_NAME):
+            path = os.path.join(dir, name)
+            os.unlink(path)
 
     gitkeep_path = os.path.join(dir, ".gitkeep")
     with open(gitkeep_path, "w") as f:
         pass
 
 
+def _write_report(path: str, reports: list[FileReport]):
+    with open(path, "w") as f:
+        json.dump([asdict(r) for r in reports], f, indent=2)
+        f.write("\n")
+
+
+def _read_manifest(dir: str) -> dict[str, str]:
+    path = os.path.join(dir, MANIFEST_FILE_NAME)
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _read_checkpoint(dir: str) -> dict[str, str]:
+    "'file_name -> Task.key' of the files completed by the previous run."
+    path = os.path.join(dir, CHECKPOINT_FILE_NAME)
+    result: dict[str, str] = {}
+
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    result.update(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # Crash when writing the last line.
+    except FileNotFoundError:
+        pass
+
+    return result
+
+
+def _write_checkpoint(dir: str, task: Task, keys: dict[str, str]):
+    path = os.path.join(dir, CHECKPOINT_FILE_NAME)
+    files = {name: keys[name] for name in task.output_file_names}
+
+    with open(path, "a") as f:
+        f.write(json.dumps(files, sort_keys=True))
+        f.write("\n")
+        # Machine may go down at any moment.
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _clear_checkpoint(dir: str):
+    path = os.path.join(dir, CHECKPOINT_FILE_NAME)
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_manifest(dir: str, manifest: dict[str, str]):
+    path = os.path.join(dir, MANIFEST_FILE_NAME)
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    os.replace(tmp_path, path)
+
+
 if __name__ == "__main__":
     main()
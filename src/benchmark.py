@@ -0,0 +1,294 @@
+"""
+Measure how fast each generator is.
+
+Every benchmark runs a single output file of a module with a fixed number of
+operands (so that the results do not depend on the current module constants)
+in a fresh process. Operand counts are chosen so that every run takes more than
+a second, the fastest of '--repeat' runs is reported.
+
+Usage:
+  python3 src/benchmark.py --save baseline.json
+  python3 src/benchmark.py --baseline baseline.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import decimal
+import argparse
+import platform
+import resource
+import tempfile
+import importlib
+import multiprocessing
+from dataclasses import asdict, dataclass
+from common import DECIMALS
+
+
+@dataclass
+class Benchmark:
+    name: str
+    module: str
+    file_name: str
+    """
+    Output file of the task to run, '{ctx}' will be replaced with 'file_header'.
+    For fused tasks all of the files are measured.
+    """
+    constants: dict[str, int]
+    "Module constants overwritten for the duration of the benchmark."
+
+
+BENCHMARKS: list[Benchmark] = [
+    Benchmark(
+        "round",
+        "test_round",
+        "round_{ctx}_toNearestOrEven_0.txt",
+        {"DECIMAL_COUNT": 40_000},
+    ),
+    Benchmark(
+        "quantize",
+        "test_quantum",
+        "quantize_{ctx}_toNearestOrEven_0.txt",
+        {"DECIMAL_COUNT": 800},
+    ),
+    Benchmark(
+        "same_quantum",
+        "test_quantum",
+        "same_quantum_{ctx}_0.txt",
+        {"DECIMAL_COUNT": 500},
+    ),
+    Benchmark(
+        "compare",
+        "test_compare",
+        "compare_{ctx}_0.txt",
+        {"DECIMAL_COUNT": 550},
+    ),
+    Benchmark(
+        "min",
+        "test_compare",
+        "min_{ctx}.txt",
+        {"DECIMAL_COUNT": 500},
+    ),
+    Benchmark(
+        "compare_total",
+        "test_compare",
+        "compare_total_{ctx}.txt",
+        {"DECIMAL_COUNT": 550},
+    ),
+    Benchmark(
+        "rem_near",
+        "test_remainder",
+        "rem_near_big_small_{ctx}.txt",
+        {"DECIMAL_BIG_REM_SMALL_COUNT": 2_500},
+    ),
+    Benchmark(
+        "logb",
+        "test_logb_scaleb_py",
+        "logb_{ctx}.txt",
+        {"LOGB_DECIMAL_COUNT": 150_000},
+    ),
+    Benchmark(
+        "scaleb",
+        "test_logb_scaleb_py",
+        "scaleb_{ctx}_toNearestOrEven.txt",
+        {"SCALEB_DECIMAL_COUNT": 800},
+    ),
+    Benchmark(
+        "next_up",
+        "test_next",
+        "next_up_{ctx}.txt",
+        {"DECIMAL_COUNT": 40_000},
+    ),
+    Benchmark(
+        "plus",
+        "test_unary",
+        "plus_{ctx}.txt",
+        {"DECIMAL_COUNT": 50_000},
+    ),
+    Benchmark(
+        "is_zero",
+        "test_properties",
+        "is_zero_{ctx}.txt",
+        {"DECIMAL_COUNT": 40_000},
+    ),
+    Benchmark(
+        "copy_sign",
+        "test_other",
+        "copy_sign_{ctx}.txt",
+        {"COPY_SIGN_COUNT": 550},
+    ),
+]
+
+
+@dataclass
+class Result:
+    name: str
+    context: str
+    seconds: float
+    lines: int
+    bytes: int
+    peak_memory: int
+    "Max resident set size of the benchmark process in bytes."
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--save", help="save results as JSON")
+    parser.add_argument("--baseline", help="JSON from the previous '--save'")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="lines/sec drop vs baseline reported as regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="run every benchmark N times and keep the fastest (default: 3)",
+    )
+    args = parser.parse_args()
+
+    benchmarks = BENCHMARKS
+
+    if args.names:
+        benchmarks = [b for b in BENCHMARKS if b.name in args.names]
+        unknown = set(args.names) - set(b.name for b in benchmarks)
+        if unknown:
+            parser.error("unknown benchmark: " + ", ".join(sorted(unknown)))
+
+    results: list[Result] = []
+    # Fresh process for every run, so that 'peak_memory' is not shared.
+    mp = multiprocessing.get_context("spawn")
+
+    for b in benchmarks:
+        for ctx in DECIMALS:
+            runs: list[Result] = []
+
+            for _ in range(args.repeat):
+                with mp.Pool(1) as pool:
+                    runs.append(pool.apply(_run, (b, ctx.file_header)))
+
+            r = min(runs, key=lambda r: r.seconds)
+            results.append(r)
+            _print(r)
+
+    if args.save:
+        _save(args.save, results)
+
+    if args.baseline:
+        baseline = _load(args.baseline)
+        regressions = _compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+def _run(benchmark: Benchmark, file_header: str) -> Result:
+    module = importlib.import_module(benchmark.module)
+
+    for name, value in benchmark.constants.items():
+        assert hasattr(module, name), f"{benchmark.module}.{name}"
+        setattr(module, name, value)
+
+    file_name = benchmark.file_name.format(ctx=file_header)
+    task = next(t for t in module.tasks() if file_name in t.file_names)
+
+    with tempfile.TemporaryDirectory() as dir:
+        start = time.perf_counter()
+        task.run(dir)
+        seconds = time.perf_counter() - start
+
+        # Fused tasks write multiple files in the same time.
+        size = 0
+        lines = 0
+
+        for name in task.output_file_names:
+            path = os.path.join(dir, name)
+            size += os.path.getsize(path)
+
+            with open(path, "rb") as f:
+                while block := f.read(1 << 20):
+                    lines += block.count(b"\n")
+
+    # Linux: kilobytes
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return Result(
+        name=benchmark.name,
+        context=file_header,
+        seconds=seconds,
+        lines=lines,
+        bytes=size,
+        peak_memory=peak_memory,
+    )
+
+
+def _print(r: Result):
+    print(
+        f"{r.name:<15} {r.context:<5}"
+        f" {r.lines_per_second:>12,.0f} lines/s"
+        f" {r.bytes_per_second / 1_000_000:>8.2f} MB/s"
+        f" {r.peak_memory / 1_000_000:>8.1f} MB peak"
+        f" ({r.lines:,} lines in {r.seconds:.2f}s)"
+    )
+
+
+def _save(path: str, results: list[Result]):
+    data = {
+        "python": platform.python_version(),
+        "libmpdec": decimal.__libmpdec_version__,
+        "results": [asdict(r) for r in results],
+    }
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def _load(path: str) -> list[Result]:
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    return [Result(**r) for r in data["results"]]
+
+
+def _compare(
+    results: list[Result],
+    baseline: list[Result],
+    threshold: float,
+) -> list[Result]:
+    "Print the change vs baseline, return results slower than 'threshold'."
+    by_key = {(b.name, b.context): b for b in baseline}
+    regressions: list[Result] = []
+
+    print()
+    print("Compared to baseline:")
+
+    for r in results:
+        b = by_key.get((r.name, r.context))
+        if b is None:
+            continue
+
+        change = r.lines_per_second / b.lines_per_second - 1
+        is_regression = change < -threshold
+        mark = "  <- REGRESSION" if is_regression else ""
+        print(f"{r.name:<15} {r.context:<5} {change:>+8.1%}{mark}")
+
+        if is_regression:
+            regressions.append(r)
+
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,21 @@
 import io
+import os
+import sys
+import array
+import time
+import gzip
+import lzma
 import random
+import shutil
+import struct
 import decimal
-from dataclasses import dataclass
+import hashlib
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, Any, Callable, Iterator, Sequence, TypeVar, overload
 from typing_extensions import TypeAlias
 
 
@@ -17,6 +31,11 @@ class Rounding:
     def __eq__(self, o: object) -> bool:
         return id(self) == id(o)
 
+    def __reduce__(self):
+        # Roundings are compared by identity, so the unpickled value (for example
+        # in a worker process) has to be the same object as the global one.
+        return (_get_rounding, (self.swift_name,))
+
 
 ROUNDING_UP = Rounding("up", ">", decimal.ROUND_CEILING)
 ROUNDING_DOWN = Rounding("down", "<", decimal.ROUND_FLOOR)
@@ -35,7 +54,16 @@ ROUNDINGS: list[Rounding] = [
 ]
 
 
-@dataclass
+def _get_rounding(swift_name: str) -> Rounding:
+    for r in ROUNDINGS:
+        if r.swift_name == swift_name:
+            return r
+
+    assert False, f"Unknown rounding: {swift_name}"
+
+
+# Frozen, because 'Decimal.as_tuple' returns a cached instance.
+@dataclass(frozen=True)
 class DecimalTuple:
     is_negative: bool
     significand: int
@@ -46,29 +74,43 @@ class DecimalTuple:
 class Decimal:
     value: decimal.Decimal
 
-    def __str__(self) -> str:
-        t = self.as_tuple()
-
-        if t is None:
-            return self.value.to_eng_string()
+    # In cartesian products every operand is used thousands of times.
+    # Format it only once.
+    _str: str | None = field(default=None, init=False, repr=False, compare=False)
+    _tuple: DecimalTuple | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
-        sign = "" if t.is_negative == 0 else "-"
-        return f"{sign}{t.significand}E{t.exponent}"
+    def __str__(self) -> str:
+        if self._str is not None:
+            return self._str
+
+        if self.value.is_finite():
+            t = self.value.as_tuple()
+            # Digits do not have leading zeros, so this is the same as 'significand'.
+            sign = "-" if t.sign else ""
+            digits = "".join(map(str, t.digits))
+            result = f"{sign}{digits}E{t.exponent}"
+        else:
+            result = self.value.to_eng_string()
+
+        self._str = result
+        return result
 
     def as_tuple(self) -> DecimalTuple | None:
+        if self._tuple is not None:
+            return self._tuple
+
         if not self.value.is_finite():
             return None
 
         t = self.value.as_tuple()
-
-        significand = 0
-        for d in t.digits:
-            significand *= 10
-            significand += d
-
         sign = bool(t.sign)
+        significand = int("".join(map(str, t.digits)))
         exponent = int(t.exponent)
-        return DecimalTuple(sign, significand, exponent)
+
+        self._tuple = DecimalTuple(sign, significand, exponent)
+        return self._tuple
 
     @staticmethod
     def from_tuple(ctx: "Context", t: DecimalTuple) -> "Decimal":
@@ -89,6 +131,170 @@ class Decimal:
         return Decimal(result)
 
 
+def finite_decimal(is_negative: bool, significand: int, exponent: int) -> Decimal:
+    "Exact value (no context), with the caches already filled."
+    sign = "-" if is_negative else ""
+    # The same as 'Decimal.__str__'.
+    s = f"{sign}{significand}E{exponent}"
+    result = Decimal(decimal.Decimal(s))
+    result._str = s
+    result._tuple = DecimalTuple(is_negative, significand, exponent)
+    return result
+
+
+# is_negative, significand, exponent
+_FiniteParts: TypeAlias = "tuple[bool, int, int]"
+
+# 'DecimalBatch' kinds, stored as 'kind << 1 | sign'.
+_KIND_FINITE = 0
+_KIND_INFINITY = 1
+_KIND_QNAN = 2
+_KIND_SNAN = 3
+_LIMB_MASK = (1 << 64) - 1
+
+
+class DecimalBatch(Sequence[Decimal]):
+    """
+    Compact list of 'Decimal' values. Signs, significands and exponents are stored
+    in arrays and 'Decimal' objects are created on access, so a batch takes about
+    20 bytes per value instead of a few hundred.
+
+    Every access creates a new 'Decimal', use 'list(batch)' when the same values
+    are used over and over again (for example in cartesian products).
+    """
+
+    def __init__(self, ctx: "Context") -> None:
+        # 'd128' significand does not fit in 64 bits.
+        self._limbs = (ctx.max_decimal_digits.bit_length() + 63) // 64
+        self._kinds = bytearray()
+        self._exponents = array.array("i")
+        self._significands = array.array("Q")
+
+    def __len__(self) -> int:
+        return len(self._kinds)
+
+    @overload
+    def __getitem__(self, index: int) -> Decimal: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Decimal]: ...
+
+    def __getitem__(self, index: int | slice) -> Decimal | list[Decimal]:
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DecimalBatch index out of range")
+
+        return self._get(index)
+
+    def __iter__(self) -> Iterator[Decimal]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def append(self, d: Decimal):
+        v = d.value
+        is_negative = v.is_signed()
+
+        if v.is_finite():
+            t = d.as_tuple()
+            assert t is not None
+            self.append_finite(is_negative, t.significand, t.exponent)
+            return
+
+        if v.is_infinite():
+            kind = _KIND_INFINITY
+            payload = 0
+        else:
+            kind = _KIND_SNAN if v.is_snan() else _KIND_QNAN
+            digits = v.as_tuple().digits
+            payload = int("".join(map(str, digits))) if digits else 0
+
+        self._append(kind, is_negative, payload, 0)
+
+    def append_finite(self, is_negative: bool, significand: int, exponent: int):
+        self._append(_KIND_FINITE, is_negative, significand, exponent)
+
+    def extend(self, other: "DecimalBatch"):
+        assert self._limbs == other._limbs
+        self._kinds.extend(other._kinds)
+        self._exponents.extend(other._exponents)
+        self._significands.extend(other._significands)
+
+    def copy(self) -> "DecimalBatch":
+        result = DecimalBatch.__new__(DecimalBatch)
+        result._limbs = self._limbs
+        result._kinds = bytearray(self._kinds)
+        result._exponents = array.array("i", self._exponents)
+        result._significands = array.array("Q", self._significands)
+        return result
+
+    def to_bytes(self) -> bytes:
+        "Arrays are in the native byte order, so only for the cache on this machine."
+        header = struct.pack("<II", self._limbs, len(self))
+        return b"".join(
+            (
+                header,
+                self._kinds,
+                self._exponents.tobytes(),
+                self._significands.tobytes(),
+            )
+        )
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "DecimalBatch":
+        limbs, count = struct.unpack_from("<II", data)
+        result = DecimalBatch.__new__(DecimalBatch)
+        result._limbs = limbs
+        result._kinds = bytearray()
+        result._exponents = array.array("i")
+        result._significands = array.array("Q")
+
+        kinds_end = 8 + count
+        exponents_end = kinds_end + count * result._exponents.itemsize
+        significands_end = exponents_end + count * limbs * 8
+
+        if len(data) != significands_end:
+            raise ValueError("Invalid DecimalBatch data")
+
+        result._kinds.extend(data[8:kinds_end])
+        result._exponents.frombytes(data[kinds_end:exponents_end])
+        result._significands.frombytes(data[exponents_end:significands_end])
+        return result
+
+    def _append(self, kind: int, is_negative: bool, significand: int, exponent: int):
+        self._kinds.append(kind << 1 | is_negative)
+        self._exponents.append(exponent)
+
+        for _ in range(self._limbs):
+            self._significands.append(significand & _LIMB_MASK)
+            significand >>= 64
+
+    def _get(self, index: int) -> Decimal:
+        k = self._kinds[index]
+        kind = k >> 1
+        is_negative = bool(k & 1)
+        sign = "-" if is_negative else ""
+
+        limbs = self._limbs
+        significand = 0
+        for i in range(index * limbs + limbs - 1, index * limbs - 1, -1):
+            significand = significand << 64 | self._significands[i]
+
+        if kind == _KIND_FINITE:
+            exponent = self._exponents[index]
+            return finite_decimal(is_negative, significand, exponent)
+
+        if kind == _KIND_INFINITY:
+            return Decimal(decimal.Decimal(sign + "Infinity"))
+
+        name = "sNaN" if kind == _KIND_SNAN else "NaN"
+        payload = str(significand) if significand else ""
+        return Decimal(decimal.Decimal(sign + name + payload))
+
+
 FlagType: TypeAlias = type[decimal.DecimalException]
 FLAG_UNDERFLOW: FlagType = decimal.Underflow
 FLAG_OVERFLOW: FlagType = decimal.Overflow
@@ -99,21 +305,61 @@ FLAG_ROUNDED: FlagType = decimal.Rounded
 FLAG_SUBNORMAL: FlagType = decimal.Subnormal
 FLAG_CLAMPED: FlagType = decimal.Clamped
 
+# Flags as bits in a single 'int'.
+# The first 5 are in the same order as 'x/u/o/z/i' in the output file.
+FlagMask: TypeAlias = int
+MASK_INEXACT: FlagMask = 1 << 0
+MASK_UNDERFLOW: FlagMask = 1 << 1
+MASK_OVERFLOW: FlagMask = 1 << 2
+MASK_DIVISION_BY_ZERO: FlagMask = 1 << 3
+MASK_INVALID_OPERATION: FlagMask = 1 << 4
+MASK_SUBNORMAL: FlagMask = 1 << 5
+# We don't care about those:
+# - decimal.Rounded
+# - decimal.Clamped
+
+_MASKS: list[tuple[FlagType, FlagMask]] = [
+    (FLAG_INEXACT, MASK_INEXACT),
+    (FLAG_UNDERFLOW, MASK_UNDERFLOW),
+    (FLAG_OVERFLOW, MASK_OVERFLOW),
+    (FLAG_DIVISION_BY_ZERO, MASK_DIVISION_BY_ZERO),
+    (FLAG_INVALID_OPERATION, MASK_INVALID_OPERATION),
+    (FLAG_SUBNORMAL, MASK_SUBNORMAL),
+]
+
+# Index with 'mask & _SUFFIX_MASK' to get the ' xuozi' part of the line.
+_SUFFIX_MASK = 0b11111
+_SUFFIXES: list[str] = []
+
+for _mask in range(_SUFFIX_MASK + 1):
+    _suffix = "".join(c for i, c in enumerate("xuozi") if _mask & (1 << i))
+    _SUFFIXES.append(" " + _suffix if _suffix else "")
+
+# Names used in the 'FileReport.flags' histogram.
+_MASK_NAMES: list[tuple[FlagMask, str]] = [
+    (MASK_INEXACT, "inexact"),
+    (MASK_UNDERFLOW, "underflow"),
+    (MASK_OVERFLOW, "overflow"),
+    (MASK_DIVISION_BY_ZERO, "divisionByZero"),
+    (MASK_INVALID_OPERATION, "invalidOperation"),
+    (MASK_SUBNORMAL, "subnormal"),
+]
+
+
+def flag_mask(*flags: FlagType) -> FlagMask:
+    result = 0
+
+    for f in flags:
+        for t, m in _MASKS:
+            if id(f) == id(t):
+                result |= m
+
+    return result
+
 
 class Flags:
     def __init__(self, context: decimal.Context) -> None:
         self._python_context = context
-        self._all = [
-            decimal.Underflow,
-            decimal.Overflow,
-            decimal.Inexact,
-            decimal.InvalidOperation,
-            decimal.DivisionByZero,
-            decimal.Subnormal,
-            # We don't care about those:
-            # decimal.Rounded,
-            # decimal.Clamped,
-        ]
 
     def is_set(self, flag: FlagType):
         return self._python_context.flags[flag]
@@ -131,6 +377,18 @@ class Flags:
     def disable_exceptions(self):
         self._python_context.clear_traps()
 
+    def snapshot(self) -> FlagMask:
+        "All of the flags that we care about as a single 'int'."
+        f = self._python_context.flags
+        return (
+            f[decimal.Inexact]
+            | f[decimal.Underflow] << 1
+            | f[decimal.Overflow] << 2
+            | f[decimal.DivisionByZero] << 3
+            | f[decimal.InvalidOperation] << 4
+            | f[decimal.Subnormal] << 5
+        )
+
     def assert_is_set(self, flag: FlagType, message: str = ""):
         is_set = self._python_context.flags[flag]
         if not is_set:
@@ -141,23 +399,27 @@ class Flags:
         self,
         message: str = "",
         *,
-        excluding: FlagType | list[FlagType] | None = None,
+        excluding: FlagMask | FlagType | list[FlagType] | None = None,
+        snapshot: FlagMask | None = None,
     ):
-        flags: list[FlagType] = []
-
-        for f in self._all:
-            is_excluded = False
-
-            if isinstance(excluding, list):
-                for e in excluding:
-                    is_excluded = is_excluded or id(f) == id(e)
-            else:
-                is_excluded = id(f) == id(excluding)
-
-            if self._python_context.flags[f] and not is_excluded:
-                flags.append(f)
-
-        if flags:
+        """
+        Pass 'excluding' as 'FlagMask' and the 'snapshot' if you already have one,
+        this is called for every line.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        if excluding is None:
+            excluding = 0
+        elif isinstance(excluding, list):
+            excluding = flag_mask(*excluding)
+        elif not isinstance(excluding, int):
+            excluding = flag_mask(excluding)
+
+        triggered = snapshot & ~excluding
+
+        if triggered:
+            flags = [t for t, m in _MASKS if triggered & m]
             m = self._create_assert_message(message, flags)
             assert False, m
 
@@ -190,10 +452,11 @@ class Context:
         self.max_decimal_digits = max_decimal_digits
         self.min_signed_exponent = min_signed_exponent
         self.max_signed_exponent = max_signed_exponent
+        self.rounding = ROUNDING_TO_ZERO
 
         self._python_context = decimal.Context(
             prec=precision,
-            rounding=ROUNDING_TO_ZERO.python,
+            rounding=self.rounding.python,
             Emin=min_signed_exponent + precision - 1,
             Emax=max_signed_exponent + precision - 1,
             capitals=True,
@@ -230,42 +493,108 @@ class Context:
             d = self._python_context.create_decimal(s)
             self._special_values.append(Decimal(d.copy_abs()))
             self._special_values.append(Decimal(d.copy_negate()))
-            self.flags.assert_empty(s, excluding=FLAG_SUBNORMAL)
+            self.flags.assert_empty(s, excluding=MASK_SUBNORMAL)
+
+    def __reduce__(self):
+        # Send only the name to the worker processes, it will use its own copy.
+        return (_get_context, (self.file_header,))
+
+    def copy(self, rounding: Rounding) -> "Context":
+        """
+        Context with its own Python context (and flags), so that the generated
+        values do not depend on what was done before with the global one.
+        """
+        # Not 'copy.copy', it would go through '__reduce__'.
+        result = Context.__new__(Context)
+        result.__dict__.update(self.__dict__)
+        result.rounding = rounding
+        result._python_context = self._python_context.copy()
+        result._python_context.rounding = rounding.python
+        result.flags = Flags(result._python_context)
+        result.flags.clear_all()
+        return result
+
+    def generate(self, count: int, *, seed: int) -> DecimalBatch:
+        cached = _get_cached_operands(self, "generate", count, seed)
+        if cached is not None:
+            return cached
+
+        result = DecimalBatch(self)
+
+        for d in self._special_values:
+            result.append(d)
+
+        for is_negative, significand, exponent in self._generate(count, seed=seed):
+            result.append_finite(is_negative, significand, exponent)
+
+        _set_cached_operands(self, "generate", count, seed, result)
+        return result
 
-    def generate(self, count: int, *, seed: int) -> list[Decimal]:
-        # Copy all special values
-        result = list(self._special_values)
+    def generate_iter(self, count: int, *, seed: int) -> Iterator[Decimal]:
+        """
+        The same values as 'generate', but created one at a time. Use it when every
+        value is needed only once, memory usage does not depend on 'count'.
+        """
+        yield from self._special_values
 
+        for parts in self._generate(count, seed=seed):
+            yield finite_decimal(*parts)
+
+    def generate_subnormals(self, count: int, *, seed: int) -> DecimalBatch:
+        cached = _get_cached_operands(self, "generate_subnormals", count, seed)
+        if cached is not None:
+            return cached
+
+        result = DecimalBatch(self)
+
+        for parts in self._generate_subnormals(count, seed=seed):
+            result.append_finite(*parts)
+
+        _set_cached_operands(self, "generate_subnormals", count, seed, result)
+        return result
+
+    def generate_subnormals_iter(self, count: int, *, seed: int) -> Iterator[Decimal]:
+        "'generate_subnormals' version of 'generate_iter'."
+        for parts in self._generate_subnormals(count, seed=seed):
+            yield finite_decimal(*parts)
+
+    def _generate(self, count: int, *, seed: int) -> Iterator[_FiniteParts]:
         # Div by 2: both signs.
-        all_count = count - len(result)
+        all_count = count - len(self._special_values)
         subnormal_count = all_count // 30
         normal_count = (all_count - subnormal_count) // 2
 
-        random.seed(seed)
-        self.flags.clear_all()
+        # Iterators run between the operations of the caller, so they can't use the
+        # flags from 'self'.
+        checks = self._python_context.copy()
+        flags = Flags(checks)
+        flags.clear_all()
+        rng = random.Random(seed)
 
         for _ in range(normal_count):
-            significand = random.randint(0, self.max_decimal_digits)
-            exponent = random.randint(
+            significand = rng.randint(0, self.max_decimal_digits)
+            exponent = rng.randint(
                 self.min_signed_exponent, self.max_signed_exponent
             )
 
-            d = self._python_context.scaleb(significand, exponent)
-            result.append(Decimal(d.copy_abs()))
-            result.append(Decimal(d.copy_negate()))
+            # 'scaleb' only to check that the value is representable.
+            checks.scaleb(significand, exponent)
 
             # It may happen that this value is subnormal.
-            self.flags.assert_empty(
-                f"{significand}E{exponent}", excluding=FLAG_SUBNORMAL
-            )
+            flags.assert_empty(f"{significand}E{exponent}", excluding=MASK_SUBNORMAL)
 
-        subnormals = self.generate_subnormals(subnormal_count, seed=seed)
-        result.extend(subnormals)
+            yield False, significand, exponent
+            yield True, significand, exponent
 
-        return result
+        yield from self._generate_subnormals(subnormal_count, seed=seed, checks=checks)
 
-    def generate_subnormals(self, count: int, *, seed: int) -> list[Decimal]:
-        result: list[Decimal] = []
+    def _generate_subnormals(
+        self,
+        count: int,
+        *,
+        seed: int,
+        checks: decimal.Context | None = None,
+    ) -> Iterator[_FiniteParts]:
         # Div by 2: both signs.
         all_count = count // 2
 
@@ -273,24 +602,29 @@ class Context:
         # - 1E(min_signed_exponent + precision - 1) = 1E(-398+16-1) = 1E−383
         # - 1E(min_signed_exponent)                 = 1E-398
         e_min = self.min_signed_exponent + self.precision - 1  # _python_context.Emin
-        random.seed(seed)
+        rng = random.Random(seed)
+
+        if checks is None:
+            checks = self._python_context.copy()
+            Flags(checks).clear_all()
+
+        flags = Flags(checks)
 
         for _ in range(all_count):
-            digit_count = random.randint(1, self.precision - 1)
-            significand = random.randint(0, pow(10, digit_count) - 1)
+            digit_count = rng.randint(1, self.precision - 1)
+            significand = rng.randint(0, pow(10, digit_count) - 1)
 
             max_exponent = e_min - digit_count
-            exponent = random.randint(self.min_signed_exponent, max_exponent)
+            exponent = rng.randint(self.min_signed_exponent, max_exponent)
 
-            d = self._python_context.scaleb(significand, exponent)
-            result.append(Decimal(d.copy_abs()))
-            result.append(Decimal(d.copy_negate()))
+            checks.scaleb(significand, exponent)
 
             message = f"{significand}E{exponent}"
-            self.flags.assert_is_set(FLAG_SUBNORMAL, message)
-            self.flags.assert_empty(message, excluding=FLAG_SUBNORMAL)
+            flags.assert_is_set(FLAG_SUBNORMAL, message)
+            flags.assert_empty(message, excluding=MASK_SUBNORMAL)
 
-        return result
+            yield False, significand, exponent
+            yield True, significand, exponent
 
 
 DECIMAL_64 = Context(
@@ -318,48 +652,764 @@ DECIMAL_128 = Context(
 DECIMALS = (DECIMAL_64, DECIMAL_128)
 
 
-def write_line(
-    f: io.TextIOWrapper,
+def _get_context(file_header: str) -> Context:
+    for c in DECIMALS:
+        if c.file_header == file_header:
+            return c
+
+    assert False, f"Unknown context: {file_header}"
+
+
+OPERAND_CACHE_FILE_EXTENSION = ".operands"
+
+# Persistent cache of the generated operands, 'None' means disabled.
+# Set once at the start (also in the worker processes).
+OPERAND_CACHE_DIR: str | None = None
+OPERAND_CACHE_MAX_SIZE = 256 * 1024 * 1024
+"In bytes, the least recently used files are removed when over the limit."
+
+# Operands generated in this process, so that the repeated calls are free even
+# without the persistent cache.
+_OPERAND_MEMO: dict[str, DecimalBatch] = {}
+_OPERAND_MEMO_COUNT = 16
+# Hash of the generator source (this file), so that the cached operands are not
+# used after 'Context.generate' changes. Computed once, see '_operand_cache_key'.
+_OPERAND_SOURCE_HASH: str | None = None
+
+
+def set_operand_cache(dir: str | None, max_size: int = OPERAND_CACHE_MAX_SIZE):
+    global OPERAND_CACHE_DIR, OPERAND_CACHE_MAX_SIZE
+    OPERAND_CACHE_DIR = dir
+    OPERAND_CACHE_MAX_SIZE = max_size
+
+
+def _operand_cache_key(ctx: Context, function: str, count: int, seed: int) -> str:
+    global _OPERAND_SOURCE_HASH
+
+    if _OPERAND_SOURCE_HASH is None:
+        with open(__file__, "rb") as f:
+            _OPERAND_SOURCE_HASH = hashlib.sha256(f.read()).hexdigest()
+
+    parts = (
+        _OPERAND_SOURCE_HASH,
+        decimal.__libmpdec_version__,
+        function,
+        count,
+        seed,
+        ctx.file_header,
+        ctx.precision,
+        ctx.max_decimal_digits,
+        ctx.min_signed_exponent,
+        ctx.max_signed_exponent,
+    )
+
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _get_cached_operands(
+    ctx: Context,
+    function: str,
+    count: int,
+    seed: int,
+) -> DecimalBatch | None:
+    "Returns a copy, the caller is free to modify it."
+    key = _operand_cache_key(ctx, function, count, seed)
+    batch = _OPERAND_MEMO.get(key)
+
+    if batch is None and OPERAND_CACHE_DIR is not None:
+        path = os.path.join(OPERAND_CACHE_DIR, key + OPERAND_CACHE_FILE_EXTENSION)
+
+        try:
+            with open(path, "rb") as f:
+                batch = DecimalBatch.from_bytes(f.read())
+
+            # Modification time is used for eviction.
+            os.utime(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+        _memoize_operands(key, batch)
+
+    return None if batch is None else batch.copy()
+
+
+def _set_cached_operands(
+    ctx: Context,
+    function: str,
+    count: int,
+    seed: int,
+    batch: DecimalBatch,
+):
+    key = _operand_cache_key(ctx, function, count, seed)
+    _memoize_operands(key, batch.copy())
+
+    dir = OPERAND_CACHE_DIR
+    if dir is None:
+        return
+
+    # Write + rename, because the workers may write the same file.
+    os.makedirs(dir, exist_ok=True)
+    path = os.path.join(dir, key + OPERAND_CACHE_FILE_EXTENSION)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        f.write(batch.to_bytes())
+
+    os.replace(tmp_path, path)
+    _evict_cached_operands(dir, OPERAND_CACHE_MAX_SIZE)
+
+
+def _memoize_operands(key: str, batch: DecimalBatch):
+    if len(_OPERAND_MEMO) >= _OPERAND_MEMO_COUNT:
+        oldest = next(iter(_OPERAND_MEMO))
+        del _OPERAND_MEMO[oldest]
+
+    _OPERAND_MEMO[key] = batch
+
+
+def _evict_cached_operands(dir: str, max_size: int):
+    files: list[tuple[float, int, str]] = []
+
+    for name in os.listdir(dir):
+        if name.endswith(OPERAND_CACHE_FILE_EXTENSION):
+            path = os.path.join(dir, name)
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Removed by another worker.
+
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in files)
+    files.sort()
+
+    for _, size, path in files:
+        if total_size <= max_size:
+            break
+
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        total_size -= size
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class Chunk:
+    "Part of the 'lhs' operands in a cartesian product."
+
+    index: int
+    count: int
+
+    def take(self, items: list[T]) -> list[T]:
+        start = len(items) * self.index // self.count
+        end = len(items) * (self.index + 1) // self.count
+        return items[start:end]
+
+
+CHUNK_ALL = Chunk(0, 1)
+
+FORMATS = ("text", "bid")
+COMPRESSIONS = ("none", "xz", "gzip")
+
+
+@dataclass
+class OutputOptions:
+    format: str = "text"
+    "'text' lines or 'bid' binary records (see 'RecordWriter')."
+    compression: str = "none"
+    compression_level: int | None = None
+    "'None' means default level for the selected compression."
+
+    def file_name(self, name: str) -> str:
+        "Add extensions for the selected format and compression."
+        if self.format == "bid":
+            name = name.removesuffix(".txt") + ".bin"
+
+        if self.compression == "xz":
+            return name + ".xz"
+        if self.compression == "gzip":
+            return name + ".gz"
+
+        return name
+
+    def open(self, path: str, stack: contextlib.ExitStack) -> IO[Any]:
+        """
+        Every file (and every chunk) is a separate compressed stream,
+        concatenated streams are still a valid 'xz'/'gzip' file.
+        """
+        is_text = self.format == "text"
+        f: IO[Any]
+
+        if self.compression == "xz":
+            mode = "wt" if is_text else "wb"
+            return stack.enter_context(
+                lzma.open(path, mode, preset=self.compression_level)
+            )
+
+        if self.compression == "gzip":
+            level = 9 if self.compression_level is None else self.compression_level
+            raw = stack.enter_context(open(path, "wb"))
+            # No file name and 'mtime', so that the output is reproducible.
+            f = gzip.GzipFile("", "wb", compresslevel=level, fileobj=raw, mtime=0)
+            f = stack.enter_context(f)
+            return stack.enter_context(io.TextIOWrapper(f)) if is_text else f
+
+        return stack.enter_context(open(path, "w" if is_text else "wb"))
+
+
+# Set once at the start (also in the worker processes).
+OUTPUT_OPTIONS = OutputOptions()
+
+
+def set_output_options(options: OutputOptions):
+    global OUTPUT_OPTIONS
+    OUTPUT_OPTIONS = options
+
+
+@dataclass
+class Task:
+    """
+    Single output file (or a few fused ones). Tasks do not share any state, so they
+    can run in parallel.
+    """
+
+    file_name: str
+    write: Callable[..., None]
+    "Called with the output path followed by 'args'."
+    args: tuple[Any, ...]
+    is_chunked: bool = False
+    """
+    Cartesian product files are huge, so a single file can be split between
+    multiple processes. 'write' will get an additional 'chunk: Chunk' argument and
+    it should iterate only over 'chunk.take(lhs_operands)'.
+    """
+    fused_file_names: tuple[str, ...] = ()
+    """
+    Files written in the same pass over the operands as 'file_name' (for example
+    all of the predicates or all of the roundings). 'write' will get a list of
+    paths (in 'file_names' order) instead of a single one.
+    """
+
+    @property
+    def file_names(self) -> tuple[str, ...]:
+        return (self.file_name,) + self.fused_file_names
+
+    @property
+    def output_file_name(self) -> str:
+        "'file_name' with the extensions of the selected format and compression."
+        return OUTPUT_OPTIONS.file_name(self.file_name)
+
+    @property
+    def output_file_names(self) -> tuple[str, ...]:
+        return tuple(map(OUTPUT_OPTIONS.file_name, self.file_names))
+
+    def run(
+        self,
+        dir: str,
+        chunk: Chunk | None = None,
+        *,
+        report: bool = False,
+    ) -> "list[FileReport] | None":
+        "With 'report' we will also measure where the time goes (for every file)."
+        path: str | list[str] = os.path.join(dir, self.output_file_name)
+        kwargs: dict[str, Any] = {}
+
+        if self.fused_file_names:
+            path = [os.path.join(dir, n) for n in self.output_file_names]
+
+        if not self.is_chunked:
+            assert chunk is None
+        elif chunk is None:
+            kwargs["chunk"] = CHUNK_ALL
+        else:
+            if isinstance(path, list):
+                path = [self._chunk_path(p, chunk) for p in path]
+            else:
+                path = self._chunk_path(path, chunk)
+
+            kwargs["chunk"] = chunk
+
+        if not report:
+            self.write(path, *self.args, **kwargs)
+            return None
+
+        global _REPORTS
+        paths = path if isinstance(path, list) else [path]
+        result = [FileReport(name) for name in self.output_file_names]
+        _REPORTS = dict(zip(paths, result, strict=True))
+        start = time.perf_counter()
+
+        try:
+            self.write(path, *self.args, **kwargs)
+        finally:
+            _REPORTS = None
+
+        # Fused files are computed in a single pass, they share the time.
+        seconds = time.perf_counter() - start
+        io_seconds = sum(r.format_seconds + r.write_seconds for r in result)
+
+        for r, p in zip(result, paths):
+            r.seconds = seconds
+            r.compute_seconds = seconds - io_seconds
+            r.bytes = os.path.getsize(p)
+
+        return result
+
+    def key(self) -> str:
+        """
+        Hash of everything that can change the contents of the file: generator
+        source, its constants (seeds, counts), task arguments and 'libmpdec' version.
+        """
+        module = sys.modules[self.write.__module__]
+        h = hashlib.sha256()
+
+        for source in (module, sys.modules[__name__]):
+            assert source.__file__
+            with open(source.__file__, "rb") as f:
+                h.update(f.read())
+
+        for name, value in sorted(vars(module).items()):
+            if name.isupper() and _is_constant(value):
+                h.update(f"{name}={value!r}\n".encode())
+
+        for name in self.output_file_names:
+            h.update(name.encode())
+
+        h.update(repr(OUTPUT_OPTIONS).encode())
+        h.update(self.write.__qualname__.encode())
+
+        for a in self.args:
+            h.update(_describe(a).encode())
+
+        h.update(decimal.__libmpdec_version__.encode())
+        return h.hexdigest()
+
+    def join_chunks(self, dir: str, count: int):
+        "Concatenate the outputs of 'run' for every 'Chunk(index, count)'."
+        for name in self.output_file_names:
+            path = os.path.join(dir, name)
+            chunk_paths = [
+                self._chunk_path(path, Chunk(index, count)) for index in range(count)
+            ]
+
+            # Write + rename, so that 'path' is never a partial file.
+            tmp_path = path + ".tmp"
+
+            with open(tmp_path, "wb") as f:
+                for chunk_path in chunk_paths:
+                    with open(chunk_path, "rb") as chunk_file:
+                        shutil.copyfileobj(chunk_file, f)
+
+            os.replace(tmp_path, path)
+
+            for chunk_path in chunk_paths:
+                os.unlink(chunk_path)
+
+    def _chunk_path(self, path: str, chunk: Chunk) -> str:
+        return f"{path}.{chunk.index}.part"
+
+
+def _is_constant(value: Any) -> bool:
+    if isinstance(value, tuple):
+        return all(map(_is_constant, value))
+
+    return isinstance(value, (int, str))
+
+
+def _describe(value: Any) -> str:
+    "Stable 'repr' (no 'id' inside) of the 'Task' argument."
+    if isinstance(value, Context):
+        return repr(
+            (
+                value.file_header,
+                value.swift_name,
+                value.bit_width,
+                value.precision,
+                value.trailing_significand_width,
+                value.max_decimal_digits,
+                value.min_signed_exponent,
+                value.max_signed_exponent,
+            )
+        )
+
+    if isinstance(value, Rounding):
+        return value.swift_name
+
+    if isinstance(value, tuple):
+        return "(" + ", ".join(map(_describe, value)) + ")"
+
+    if callable(value):
+        return value.__qualname__
+
+    return repr(value)
+
+
+@dataclass
+class FileReport:
+    """
+    Where the time goes when generating a single file. For chunked files the
+    chunks are added together, so 'seconds' is the sum over all of the workers.
+
+    Fused files are computed in a single pass, so their 'seconds' and
+    'compute_seconds' are for the whole 'Task' (the same for every file). Other
+    fields are counted for the file itself.
+    """
+
+    file_name: str
+    seconds: float = 0
+    compute_seconds: float = 0
+    "Everything except 'format' and 'write', mostly 'decimal' and 'Flags'."
+    format_seconds: float = 0
+    "Converting lines to 'str' (or BID records)."
+    write_seconds: float = 0
+    """
+    Waiting for the writer thread (when its queue is full) and closing the file.
+    Writing itself (including compression) overlaps with computing.
+    """
+    lines: int = 0
+    bytes: int = 0
+    flags: dict[str, int] = field(default_factory=dict)
+    "Number of lines with a given flag, 'none' for lines without any."
+
+    def add(self, other: "FileReport"):
+        self.seconds += other.seconds
+        self.compute_seconds += other.compute_seconds
+        self.format_seconds += other.format_seconds
+        self.write_seconds += other.write_seconds
+        self.lines += other.lines
+        self.bytes += other.bytes
+
+        for name, count in other.flags.items():
+            self.flags[name] = self.flags.get(name, 0) + count
+
+    def _add_flags(self, masks: dict[FlagMask, int]):
+        for mask, count in masks.items():
+            names = [n for m, n in _MASK_NAMES if mask & m] or ["none"]
+
+            for name in names:
+                self.flags[name] = self.flags.get(name, 0) + count
+
+
+# Reports of the files of the currently running 'Task' (if requested), by path.
+_REPORTS: dict[str, FileReport] | None = None
+
+Argument: TypeAlias = "Decimal | int | float"
+Expected: TypeAlias = "str | bool | int | Decimal"
+
+LINE_BATCH_SIZE = 10_000
+
+WRITE_QUEUE_SIZE = 8
+"Max number of blocks waiting for the writer thread, computing waits when it is full."
+
+
+class _WriterThread:
+    "Single thread per process for all of the files, so the blocks stay in order."
+
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="writer")
+        self.slots = threading.Semaphore(WRITE_QUEUE_SIZE)
+
+
+_WRITER_THREAD: _WriterThread | None = None
+
+
+def _get_writer_thread() -> _WriterThread:
+    global _WRITER_THREAD
+
+    # Forked worker does not have the thread of its parent.
+    if _WRITER_THREAD is None or _WRITER_THREAD.pid != os.getpid():
+        _WRITER_THREAD = _WriterThread()
+
+    return _WRITER_THREAD
+
+
+class _QueuedFile:
+    "Writes blocks on the writer thread, so that computing does not wait for I/O."
+
+    def __init__(self, f: IO[Any]) -> None:
+        self._f = f
+        self._thread = _get_writer_thread()
+        self._pending: deque[Future[Any]] = deque()
+
+    def write(self, data: Any):
+        thread = self._thread
+        thread.slots.acquire()
+
+        future = thread.executor.submit(self._f.write, data)
+        future.add_done_callback(lambda _: thread.slots.release())
+        self._pending.append(future)
+
+        # Raise write errors as soon as possible.
+        while self._pending and self._pending[0].done():
+            self._pending.popleft().result()
+
+    def wait(self):
+        "Wait until all of the blocks are written."
+        while self._pending:
+            self._pending.popleft().result()
+
+
+class LineWriter:
+    """
+    Collects the lines of a single file (so: the same context, operation and
+    rounding) and writes them in big blocks.
+    """
+
+    def __init__(
+        self,
+        f: IO[Any] | _QueuedFile,
+        context: Context,
+        operation: str,
+        rounding: Rounding,
+        report: FileReport | None = None,
+    ) -> None:
+        self._f = f
+        self._report = report
+        self._context = context
+        self._rounding = rounding
+        self._flags = context.flags
+        self._prefix = f"{context.file_header}{operation} {rounding.encoded} "
+        self._rows: list[tuple[list[Argument], Expected, FlagMask]] = []
+
+    def append(
+        self,
+        arguments: list[Argument],
+        expected: Expected,
+        flags: FlagMask | None = None,
+    ):
+        "Add line. Without 'flags' we will use the ones currently set in the context."
+        if flags is None:
+            flags = self._flags.snapshot()
+
+        self._rows.append((arguments, expected, flags))
+
+        if len(self._rows) >= LINE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        report = self._report
+
+        if report is None:
+            self._f.write(self._format())
+            self._rows.clear()
+            return
+
+        start = time.perf_counter()
+        data = self._format()
+        formatted = time.perf_counter()
+        self._f.write(data)
+        written = time.perf_counter()
+
+        report.format_seconds += formatted - start
+        report.write_seconds += written - formatted
+        report.lines += len(self._rows)
+
+        masks: dict[FlagMask, int] = {}
+        for _, _, flags in self._rows:
+            masks[flags] = masks.get(flags, 0) + 1
+
+        report._add_flags(masks)
+        self._rows.clear()
+
+    def _format(self) -> Any:
+        prefix = self._prefix
+        suffixes = _SUFFIXES
+        lines: list[str] = []
+
+        for arguments, expected, flags in self._rows:
+            args = " ".join(map(str, arguments))
+
+            if isinstance(expected, bool):
+                expected = "1" if expected else "0"
+
+            suffix = suffixes[flags & _SUFFIX_MASK]
+            lines.append(f"{prefix}{args} -> {expected}{suffix}\n")
+
+        return "".join(lines)
+
+
+# Expected values of the compare operations in the binary format.
+_COMPARE_CODES = {"lt": 0, "eq": 1, "gt": 2, "nan": 3}
+# Swift 'Int.max' and 'Int.min' (for example 'logb(nan)').
+_INT_CODES = {"max": 9223372036854775807, "min": -9223372036854775808}
+
+
+class RecordWriter(LineWriter):
+    """
+    Binary version of the 'LineWriter'. Every line is a fixed size record:
+    - operands - 'Decimal' as IEEE 754 BID bit pattern, 'int' as 'Int64'
+    - expected - 'Decimal' as BID; 'bool' and compare result ('lt', 'eq', 'gt',
+      'nan') as 'UInt8'; 'int' (including 'max' and 'min') as 'Int64'
+    - rounding - 'UInt8', index in 'ROUNDINGS'
+    - flags - 'UInt8', the same bits as 'x/u/o/z/i' in the text format
+    Everything is little endian.
+    """
+
+    def _format(self) -> Any:
+        ctx = self._context
+        tail = bytes([ROUNDINGS.index(self._rounding)])
+        records: list[bytes] = []
+
+        for arguments, expected, flags in self._rows:
+            for a in arguments:
+                records.append(_encode_value(ctx, a))
+
+            if isinstance(expected, bool):
+                records.append(bytes([expected]))
+            elif isinstance(expected, str) and expected in _COMPARE_CODES:
+                records.append(bytes([_COMPARE_CODES[expected]]))
+            elif isinstance(expected, str) and expected in _INT_CODES:
+                records.append(struct.pack("<q", _INT_CODES[expected]))
+            else:
+                records.append(_encode_value(ctx, expected))
+
+            records.append(tail)
+            records.append(bytes([flags & _SUFFIX_MASK]))
+
+        return b"".join(records)
+
+
+def _encode_value(ctx: Context, value: "Argument | Expected") -> bytes:
+    if isinstance(value, int):
+        return struct.pack("<q", value)
+
+    if isinstance(value, str):
+        # Strings are used for values that Python can't produce, for example
+        # '0E-398' (Python always sets the exponent of 0 to 0).
+        value = Decimal(decimal.Decimal(value))
+
+    assert isinstance(value, Decimal), f"Can't encode {value!r}"
+    bits = encode_bid(ctx, value)
+    return bits.to_bytes(ctx.bit_width // 8, "little")
+
+
+def encode_bid(ctx: Context, d: Decimal) -> int:
+    "IEEE 754 binary integer decimal (BID) encoding."
+    bit_width = ctx.bit_width
+    t_width = ctx.trailing_significand_width
+    sign = (1 << (bit_width - 1)) if d.value.is_signed() else 0
+
+    if d.value.is_snan():
+        return sign | (0b111111 << (bit_width - 7))
+    if d.value.is_qnan():
+        return sign | (0b111110 << (bit_width - 7))
+    if d.value.is_infinite():
+        return sign | (0b11110 << (bit_width - 6))
+
+    t = d.as_tuple()
+    assert t is not None
+    significand = t.significand
+    exponent = t.exponent - ctx.min_signed_exponent
+
+    if significand < (1 << (t_width + 3)):
+        return sign | (exponent << (t_width + 3)) | significand
+
+    # Significand starts with '100' which is implicit.
+    significand &= (1 << (t_width + 1)) - 1
+    return sign | (0b11 << (bit_width - 3)) | (exponent << (t_width + 1)) | significand
+
+
+@contextlib.contextmanager
+def open_lines(
+    path: str,
     context: Context,
     operation: str,
     rounding: Rounding,
-    arguments: list[Decimal | int | float],
-    expected: str | bool | Decimal,
-):
-    f.write(context.file_header)
-    f.write(operation)
-    f.write(" ")
-    f.write(rounding.encoded)
+) -> Iterator[LineWriter]:
+    """
+    Lines are written on the writer thread to 'path.tmp', which is renamed to
+    'path' when complete. So 'path' never contains a partial file.
+    """
+    tmp_path = path + ".tmp"
+    is_complete = False
+
+    try:
+        with contextlib.ExitStack() as stack:
+            f = _QueuedFile(OUTPUT_OPTIONS.open(tmp_path, stack))
+            # Before the file is closed.
+            stack.callback(f.wait)
+
+            report = None if _REPORTS is None else _REPORTS[path]
+
+            if OUTPUT_OPTIONS.format == "bid":
+                lines = RecordWriter(f, context, operation, rounding, report)
+            else:
+                lines = LineWriter(f, context, operation, rounding, report)
+
+            yield lines
+            lines.flush()
+
+            # Closing waits for the writer thread and flushes the buffers (and the
+            # compressor), so it is also 'write'.
+            if report is not None:
+                start = time.perf_counter()
+                stack.close()
+                report.write_seconds += time.perf_counter() - start
+
+        os.replace(tmp_path, path)
+        is_complete = True
+    finally:
+        if not is_complete:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+
+
+@contextlib.contextmanager
+def open_fused_lines(
+    paths: list[str],
+    files: list[tuple[Context, str, Rounding]],
+) -> Iterator[list[LineWriter]]:
+    "'open_lines' for every path of the fused 'Task' (with its context, operation...)."
+    with contextlib.ExitStack() as stack:
+        yield [
+            stack.enter_context(open_lines(path, context, operation, rounding))
+            for path, (context, operation, rounding) in zip(paths, files, strict=True)
+        ]
 
-    for d in arguments:
-        f.write(" ")
-        f.write(str(d))
 
-    f.write(" -> ")
+# Results with those flags may be different for other roundings.
+_ROUNDING_DEPENDENT_MASK = MASK_INEXACT | MASK_INVALID_OPERATION
 
-    if isinstance(expected, bool):
-        f.write("1" if expected else "0")
-    else:
-        f.write(str(expected))
 
-    flags = ""
+def apply_all_roundings(
+    contexts: list[Context],
+    apply: Callable[[Context], tuple[T, FlagMask]],
+    *,
+    rounding_dependent: FlagMask = _ROUNDING_DEPENDENT_MASK,
+) -> list[tuple[T, FlagMask]]:
+    """
+    'apply' (which returns result and flags) for every context, they should differ
+    only in rounding. Exact results are the same for every rounding, so if the
+    1st context does not set any of the 'rounding_dependent' flags then its result
+    is reused.
+    """
+    first = apply(contexts[0])
 
-    if context.flags.is_set(FLAG_INEXACT):
-        flags += "x"
-    if context.flags.is_set(FLAG_UNDERFLOW):
-        flags += "u"
-    if context.flags.is_set(FLAG_OVERFLOW):
-        flags += "o"
-    if context.flags.is_set(FLAG_DIVISION_BY_ZERO):
-        flags += "z"
-    if context.flags.is_set(FLAG_INVALID_OPERATION):
-        flags += "i"
+    if not first[1] & rounding_dependent:
+        return [first] * len(contexts)
 
-    if flags:
-        f.write(" ")
-        f.write(flags)
+    return [first] + [apply(c) for c in contexts[1:]]
 
-    f.write("\n")
+
+def write_line(
+    f: io.TextIOWrapper,
+    context: Context,
+    operation: str,
+    rounding: Rounding,
+    arguments: list[Argument],
+    expected: Expected,
+):
+    "Write a single line. Prefer 'open_lines' when writing the whole file."
+    lines = LineWriter(f, context, operation, rounding)
+    lines.append(arguments, expected)
+    lines.flush()
 
 
 def round_infinitely_big_value(
@@ -431,14 +1481,176 @@ def round_infinitely_small_value(
     return zero
 
 
+# Operations that only change the sign, move to the neighbor value or look at the
+# value, computed on (sign, significand, exponent) without 'decimal.Context'.
+# Callers check them with 'decimal' for a sample of the operands.
+
+
+def is_negative(d: Decimal) -> bool:
+    t = d.as_tuple()
+    return d.value.is_signed() if t is None else t.is_negative
+
+
+def with_sign(d: Decimal, is_negative: bool) -> Decimal:
+    "'d' with the given sign (also for NaN and infinity)."
+    t = d.as_tuple()
+
+    if t is None:
+        v = d.value.copy_abs()
+        return Decimal(v.copy_negate() if is_negative else v)
+
+    if t.is_negative == is_negative:
+        return d
+
+    return finite_decimal(is_negative, t.significand, t.exponent)
+
+
+def is_subnormal(ctx: Context, d: Decimal) -> bool:
+    t = d.as_tuple()
+
+    if t is None or t.significand == 0:
+        return False
+
+    # Adjusted exponent < Emin
+    digit_count = len(str(t.significand))
+    return t.exponent + digit_count < ctx.min_signed_exponent + ctx.precision
+
+
+def is_normal(ctx: Context, d: Decimal) -> bool:
+    t = d.as_tuple()
+
+    if t is None or t.significand == 0:
+        return False
+
+    return not is_subnormal(ctx, d)
+
+
+def next_up(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
+    "'decimal.Context.next_plus'."
+    t = d.as_tuple()
+
+    if t is None:
+        v = d.value
+
+        if v.is_snan():
+            quiet = str(v).replace("sNaN", "NaN")
+            return Decimal(decimal.Decimal(quiet)), MASK_INVALID_OPERATION
+
+        if v.is_infinite() and v.is_signed():
+            s = ctx.max_decimal_digits
+            return finite_decimal(True, s, ctx.max_signed_exponent), 0
+
+        return d, 0
+
+    significand = t.significand
+
+    if significand == 0:
+        return finite_decimal(False, 1, ctx.min_signed_exponent), 0
+
+    # 'decimal' adds the value smaller than the least nonzero magnitude, and then
+    # rounds it up. The result has all of the 'precision' digits (unless it is
+    # subnormal).
+    digit_count = len(str(significand))
+    adjusted = t.exponent + digit_count - 1
+
+    if t.is_negative and significand == 10 ** (digit_count - 1):
+        # -1000 -> -999.9999, 1 digit more after the decimal point.
+        adjusted -= 1
+
+    exponent = max(adjusted - ctx.precision + 1, ctx.min_signed_exponent)
+    significand *= 10 ** (t.exponent - exponent)
+
+    if t.is_negative:
+        return finite_decimal(True, significand - 1, exponent), 0
+
+    significand += 1
+
+    if significand > ctx.max_decimal_digits:
+        significand //= 10
+        exponent += 1
+
+        if exponent > ctx.max_signed_exponent:
+            return ctx.infinity, 0
+
+    return finite_decimal(False, significand, exponent), 0
+
+
+def next_down(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
+    "'decimal.Context.next_minus', which is 'next_up' of the negated value."
+    result, flags = next_up(ctx, with_sign(d, not is_negative(d)))
+    return with_sign(result, not is_negative(result)), flags
+
+
+# Results computed without 'decimal.Context' are checked with it (oracle) for the
+# special values and every N-th of the other operands.
+ORACLE_SAMPLE_STEP = 97
+
+UnaryOperation: TypeAlias = tuple[
+    str,
+    Callable[[Context, Decimal], tuple[Decimal, FlagMask]],
+    Callable[[decimal.Context, decimal.Decimal], decimal.Decimal],
+]
+"Name, function, 'decimal' oracle."
+
+
+def is_oracle_checked(ctx: Context, index: int, *operand_indices: int) -> bool:
+    """
+    Should the 'index'-th result be checked with 'decimal'?
+
+    'operand_indices' are the indices in 'Context.generate', which starts with the
+    special values. Results for them are always checked.
+    """
+    if index % ORACLE_SAMPLE_STEP == 0:
+        return True
+
+    special_count = len(ctx._special_values)
+    return any(i < special_count for i in operand_indices)
+
+
+def check_result(
+    message: str,
+    result: Any,
+    flags: FlagMask,
+    expected: Any,
+    expected_flags: FlagMask,
+):
+    "Compare the result with the one from 'decimal' (oracle)."
+    assert str(result) == str(expected), f"{message}: {result} vs {expected}"
+    assert flags == expected_flags, f"{message}: flags {flags} vs {expected_flags}"
+
+
+def check_oracle(
+    message: str,
+    result: Any,
+    flags: FlagMask,
+    ctx: Context,
+    oracle: Callable[..., Any],
+    *operands: Decimal,
+    excluding: FlagMask = 0,
+):
+    """
+    'check_result' with 'oracle(ctx._python_context, *operands)'.
+    Flags other than the 'excluding' ones are not expected from the oracle.
+    """
+    ctx.flags.clear_all()
+    expected = oracle(ctx._python_context, *(d.value for d in operands))
+    expected_flags = ctx.flags.snapshot()
+
+    if isinstance(expected, decimal.Decimal):
+        expected = Decimal(expected)
+
+    ctx.flags.assert_empty(message, excluding=excluding, snapshot=expected_flags)
+    check_result(message, result, flags, expected, expected_flags)
+
+
 def random_ints(count: int, *, min: int, max: int, seed: int) -> list[int]:
     # Div by 2: both signs.
     count = count // 2
-    random.seed(seed)
+    rng = random.Random(seed)
     result: list[int] = []
 
     for _ in range(count):
-        i = random.randint(min, max)
+        i = rng.randint(min, max)
         result.append(+i)
         result.append(-i)
 
@@ -456,10 +1668,10 @@ def random_floats(count, *, seed: int) -> list[float]:
     # Div by 2: both signs.
     rest_count = count - len(result)
     rest_count = rest_count // 2
-    random.seed(seed)
+    rng = random.Random(seed)
 
     for _ in range(rest_count):
-        d = random.random()
+        d = rng.random()
         result.append(+d)
         result.append(-d)
 
@@ -1,15 +1,18 @@
-import os
 import decimal
-from typing import Callable
+from typing import Any, Callable
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
-    FLAG_SUBNORMAL,
-    FLAG_INVALID_OPERATION,
+    MASK_SUBNORMAL,
+    MASK_INVALID_OPERATION,
     Decimal,
+    Chunk,
     Context,
-    FlagType,
-    write_line,
+    FlagMask,
+    Task,
+    check_result,
+    is_oracle_checked,
+    open_lines,
 )
 
 # We will do cartesian product on them.
@@ -26,171 +29,389 @@ SEEDS: tuple[int, ...] = (
 )
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
     for ctx in DECIMALS:
         # Compare has multiple files
         for index, seed in enumerate(SEEDS):
-            _write_compare_file(dir, ctx, index, seed)
+            file_name = f"compare_{ctx.file_header}_{index}.txt"
+            task = Task(file_name, _write_compare_file, (ctx, seed), is_chunked=True)
+            result.append(task)
 
         # Everything else has 1 file.
-        ds = ctx.generate(DECIMAL_COUNT, seed=SEEDS[0])
-
-        _write_min_max_file(dir, ctx, ds, "min", lambda c, l, r: c.min(l, r))
-        _write_min_max_file(dir, ctx, ds, "min_mag", lambda c, l, r: c.min_mag(l, r))
-        _write_min_max_file(dir, ctx, ds, "max", lambda c, l, r: c.max(l, r))
-        _write_min_max_file(dir, ctx, ds, "max_mag", lambda c, l, r: c.max_mag(l, r))
-
-        _write_compare_total(
-            dir, ctx, ds, "compare_total", lambda c, l, r: c.compare_total(l, r)
-        )
-        _write_compare_total(
-            dir, ctx, ds, "compare_total_mag", lambda c, l, r: c.compare_total_mag(l, r)
+        def add(
+            operation: str,
+            write: Callable[..., None],
+            apply: Callable[
+                [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
+            ],
+        ):
+            file_name = f"{operation}_{ctx.file_header}.txt"
+            args = (ctx, operation, apply)
+            result.append(Task(file_name, write, args, is_chunked=True))
+
+        add("min", _write_min_max_file, decimal.Context.min)
+        add("min_mag", _write_min_max_file, decimal.Context.min_mag)
+        add("max", _write_min_max_file, decimal.Context.max)
+        add("max_mag", _write_min_max_file, decimal.Context.max_mag)
+
+        add("compare_total", _write_compare_total, decimal.Context.compare_total)
+        add(
+            "compare_total_mag",
+            _write_compare_total,
+            decimal.Context.compare_total_mag,
         )
 
+    return result
+
 
 def _write_compare_file(
-    dir: str,
+    path: str,
     ctx: Context,
-    file_index: int,
     seed: int,
+    chunk: Chunk,
 ):
     operation = "compare"
-    decimals = ctx.generate(DECIMAL_COUNT, seed=seed)
-
-    file_name = f"{operation}_{ctx.file_header}_{file_index}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
 
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
-
-    with open(path, "w") as f:
-        for lhs in decimals:
-            for rhs in decimals:
-                ctx.flags.clear_all()
-                result_decimal = ctx_python.compare(lhs.value, rhs.value)
+    ctx = ctx.copy(rounding)
+    decimals = list(ctx.generate(DECIMAL_COUNT, seed=seed))
+    decimal_count = len(decimals)
 
-                excluded_flags: list[FlagType] = []
+    # Instead of 'compare' for every pair we sort the operands once.
+    ranks = _ranks([_numeric_key(d) for d in decimals])
+    is_snan = [d.value.is_snan() for d in decimals]
 
-                if ctx_python.is_snan(lhs.value) or ctx_python.is_snan(rhs.value):
-                    excluded_flags.append(FLAG_INVALID_OPERATION)
-
-                ctx.flags.assert_empty(excluding=excluded_flags)
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for lhs_index, lhs in chunk.take(list(enumerate(decimals))):
+            lhs_rank = ranks[lhs_index]
 
+            for rhs_index, rhs in enumerate(decimals):
+                rhs_rank = ranks[rhs_index]
                 result: str
 
-                if ctx_python.is_nan(result_decimal):
+                if lhs_rank is None or rhs_rank is None:
                     result = "nan"
-                elif ctx_python.is_zero(result_decimal):
-                    result = "eq"
-                elif ctx_python.is_signed(result_decimal):
-                    result = "lt"
                 else:
-                    result = "gt"
+                    result = _compare_ranks(lhs_rank, rhs_rank)
+
+                # Quiet NaN does not signal.
+                flags: FlagMask = 0
+                if is_snan[lhs_index] or is_snan[rhs_index]:
+                    flags = MASK_INVALID_OPERATION
+
+                pair_index = lhs_index * decimal_count + rhs_index
+                if is_oracle_checked(ctx, pair_index, lhs_index, rhs_index):
+                    expected, expected_flags = _apply_compare(ctx, lhs, rhs)
+                    _check(operation, lhs, rhs, result, flags, expected, expected_flags)
+
+                lines.append([lhs, rhs], result, flags)
+
+
+def _apply_compare(ctx: Context, lhs: Decimal, rhs: Decimal) -> tuple[str, FlagMask]:
+    ctx_python = ctx._python_context
+    ctx.flags.clear_all()
+    result_decimal = ctx_python.compare(lhs.value, rhs.value)
+
+    excluded_flags: FlagMask = 0
+
+    if ctx_python.is_snan(lhs.value) or ctx_python.is_snan(rhs.value):
+        excluded_flags |= MASK_INVALID_OPERATION
+
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(excluding=excluded_flags, snapshot=flags)
+
+    result: str
 
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[lhs, rhs],
-                    expected=result,
-                )
+    if ctx_python.is_nan(result_decimal):
+        result = "nan"
+    elif ctx_python.is_zero(result_decimal):
+        result = "eq"
+    elif ctx_python.is_signed(result_decimal):
+        result = "lt"
+    else:
+        result = "gt"
+
+    return result, flags
 
 
 def _write_min_max_file(
-    dir: str,
+    path: str,
     ctx: Context,
-    decimals: list[Decimal],
     operation: str,
     apply: Callable[
         [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
     ],
+    chunk: Chunk,
 ):
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
+    ctx = ctx.copy(rounding)
     ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    decimals = list(ctx.generate(DECIMAL_COUNT, seed=SEEDS[0]))
+    decimal_count = len(decimals)
+
+    is_max = operation.startswith("max")
+    is_mag = operation.endswith("_mag")
+
+    # Python compares numeric values (or magnitudes) and then uses the total order
+    # to choose between the equal ones.
+    order = _ranks([_numeric_key(d, magnitude=is_mag) for d in decimals])
+    total_order = _ranks([_total_order_key(d) for d in decimals])
+
+    is_zero = [d.value.is_zero() for d in decimals]
+    is_qnan = [d.value.is_qnan() for d in decimals]
+    is_snan = [d.value.is_snan() for d in decimals]
+    is_subnormal = [ctx_python.is_subnormal(d.value) for d in decimals]
+    quiet = [_quiet(d) for d in decimals]
+
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for lhs_index, lhs in chunk.take(list(enumerate(decimals))):
+            for rhs_index, rhs in enumerate(decimals):
+                result: Decimal
+                result_index = -1
+                flags: FlagMask = 0
+
+                if is_snan[lhs_index]:
+                    result = quiet[lhs_index]
+                    flags = MASK_INVALID_OPERATION
+                elif is_snan[rhs_index]:
+                    result = quiet[rhs_index]
+                    flags = MASK_INVALID_OPERATION
+
+                    # min(qNaN, -sNaN) -> qNaN, Python returns -qNaN
+                    if is_qnan[lhs_index]:
+                        value = result.value.copy_sign(lhs.value)
+                        result = Decimal(value)
+                elif is_qnan[lhs_index] and is_qnan[rhs_index]:
+                    result_index = lhs_index
+                elif is_qnan[lhs_index]:
+                    result_index = rhs_index
+                elif is_qnan[rhs_index]:
+                    result_index = lhs_index
+                elif is_zero[lhs_index] and is_zero[rhs_index]:
+                    # min(0E5, 0E2) -> 0E5, Python returns 0E2 (lower exponent)
+                    result_index = lhs_index
+                else:
+                    lhs_rank = order[lhs_index]
+                    rhs_rank = order[rhs_index]
+
+                    if lhs_rank == rhs_rank:
+                        lhs_rank = total_order[lhs_index]
+                        rhs_rank = total_order[rhs_index]
+
+                    assert lhs_rank is not None and rhs_rank is not None
+                    is_lhs_less = lhs_rank < rhs_rank
 
-    with open(path, "w") as f:
-        for lhs in decimals:
-            for rhs in decimals:
-                ctx.flags.clear_all()
-                result = apply(ctx_python, lhs.value, rhs.value)
+                    if is_max:
+                        result_index = rhs_index if is_lhs_less else lhs_index
+                    else:
+                        result_index = lhs_index if is_lhs_less else rhs_index
 
-                # min(qNaN, -sNaN) -> qNaN, Python returns -qNaN
-                if ctx_python.is_qnan(lhs.value) and ctx_python.is_snan(rhs.value):
-                    result = ctx_python.copy_sign(result, lhs.value)
+                if result_index != -1:
+                    result = decimals[result_index]
 
-                # min(0E5, 0E2) -> 0E5, Python returns 0E2 (lower exponent)
-                if ctx_python.is_zero(lhs.value) and ctx_python.is_zero(rhs.value):
-                    result = lhs.value
+                    if is_subnormal[result_index]:
+                        flags |= MASK_SUBNORMAL
 
-                excluded_flags: list[FlagType] = []
+                pair_index = lhs_index * decimal_count + rhs_index
+                if is_oracle_checked(ctx, pair_index, lhs_index, rhs_index):
+                    expected, expected_flags = _apply_min_max(ctx, apply, lhs, rhs)
+                    _check(operation, lhs, rhs, result, flags, expected, expected_flags)
 
-                if ctx_python.is_snan(lhs.value) or ctx_python.is_snan(rhs.value):
-                    excluded_flags.append(FLAG_INVALID_OPERATION)
+                lines.append([lhs, rhs], result, flags)
 
-                if ctx_python.is_subnormal(result):
-                    excluded_flags.append(FLAG_SUBNORMAL)
 
-                ctx.flags.assert_empty(excluding=excluded_flags)
+def _apply_min_max(
+    ctx: Context,
+    apply: Callable[
+        [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
+    ],
+    lhs: Decimal,
+    rhs: Decimal,
+) -> tuple[Decimal, FlagMask]:
+    ctx_python = ctx._python_context
+    ctx.flags.clear_all()
+    result = apply(ctx_python, lhs.value, rhs.value)
 
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[lhs, rhs],
-                    expected=Decimal(result),
-                )
+    # min(qNaN, -sNaN) -> qNaN, Python returns -qNaN
+    if ctx_python.is_qnan(lhs.value) and ctx_python.is_snan(rhs.value):
+        result = ctx_python.copy_sign(result, lhs.value)
+
+    # min(0E5, 0E2) -> 0E5, Python returns 0E2 (lower exponent)
+    if ctx_python.is_zero(lhs.value) and ctx_python.is_zero(rhs.value):
+        result = lhs.value
+
+    excluded_flags: FlagMask = 0
+
+    if ctx_python.is_snan(lhs.value) or ctx_python.is_snan(rhs.value):
+        excluded_flags |= MASK_INVALID_OPERATION
+
+    if ctx_python.is_subnormal(result):
+        excluded_flags |= MASK_SUBNORMAL
+
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(excluding=excluded_flags, snapshot=flags)
+
+    return Decimal(result), flags
 
 
 def _write_compare_total(
-    dir: str,
+    path: str,
     ctx: Context,
-    decimals: list[Decimal],
     operation: str,
     apply: Callable[
         [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
     ],
+    chunk: Chunk,
 ):
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
+    ctx = ctx.copy(rounding)
+    decimals = list(ctx.generate(DECIMAL_COUNT, seed=SEEDS[0]))
+    decimal_count = len(decimals)
+
+    is_mag = operation.endswith("_mag")
+    ranks = _ranks([_total_order_key(d, magnitude=is_mag) for d in decimals])
+
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for lhs_index, lhs in chunk.take(list(enumerate(decimals))):
+            lhs_rank = ranks[lhs_index]
+            assert lhs_rank is not None
+
+            for rhs_index, rhs in enumerate(decimals):
+                rhs_rank = ranks[rhs_index]
+                assert rhs_rank is not None
+
+                result = _compare_ranks(lhs_rank, rhs_rank)
+                # Total order does not signal, even for sNaN.
+                flags: FlagMask = 0
+
+                pair_index = lhs_index * decimal_count + rhs_index
+                if is_oracle_checked(ctx, pair_index, lhs_index, rhs_index):
+                    expected, expected_flags = _apply_compare_total(
+                        ctx, apply, lhs, rhs
+                    )
+                    _check(operation, lhs, rhs, result, flags, expected, expected_flags)
+
+                lines.append([lhs, rhs], result, flags)
+
+
+def _apply_compare_total(
+    ctx: Context,
+    apply: Callable[
+        [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
+    ],
+    lhs: Decimal,
+    rhs: Decimal,
+) -> tuple[str, FlagMask]:
     ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    ctx.flags.clear_all()
+    result_decimal = apply(ctx_python, lhs.value, rhs.value)
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(snapshot=flags)
 
-    with open(path, "w") as f:
-        for lhs in decimals:
-            for rhs in decimals:
-                ctx.flags.clear_all()
-                result_decimal = apply(ctx_python, lhs.value, rhs.value)
-                ctx.flags.assert_empty()
+    result: str
 
-                result: str
+    if ctx_python.is_zero(result_decimal):
+        result = "eq"
+    elif ctx_python.is_signed(result_decimal):
+        result = "lt"
+    else:
+        result = "gt"
 
-                if ctx_python.is_zero(result_decimal):
-                    result = "eq"
-                elif ctx_python.is_signed(result_decimal):
-                    result = "lt"
-                else:
-                    result = "gt"
-
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[lhs, rhs],
-                    expected=result,
-                )
+    return result, flags
+
+
+def _ranks(keys: list[Any]) -> list[int | None]:
+    """
+    Position in the order given by 'keys', equal keys have the same rank.
+    'None' keys (for example NaN in the numeric order) do not have a rank.
+    """
+    result: list[int | None] = [None] * len(keys)
+    indices = [i for i, k in enumerate(keys) if k is not None]
+    indices.sort(key=lambda i: keys[i])
+
+    rank = -1
+    previous: Any = None
+
+    for i in indices:
+        key = keys[i]
+
+        if rank == -1 or key != previous:
+            rank += 1
+            previous = key
+
+        result[i] = rank
+
+    return result
+
+
+def _compare_ranks(lhs: int, rhs: int) -> str:
+    if lhs == rhs:
+        return "eq"
+    if lhs < rhs:
+        return "lt"
+    return "gt"
+
+
+def _numeric_key(d: Decimal, *, magnitude: bool = False) -> decimal.Decimal | None:
+    "Equal values (for example '0E5' and '-0E2') have equal keys, 'None' for NaN."
+    if d.value.is_nan():
+        return None
+
+    # Exact comparison, does not use the context.
+    return d.value.copy_abs() if magnitude else d.value
+
+
+def _total_order_key(d: Decimal, *, magnitude: bool = False) -> tuple[Any, ...]:
+    """
+    IEEE 754 total order:
+    -NaN < -sNaN < -Infinity < -finite < -0 < +0 < +finite < +Infinity < +sNaN < +NaN
+
+    Equal finite values are ordered by exponent (lower exponent is less for
+    positive values). Negative values are a mirror image of the positive ones.
+    """
+    value = d.value
+    key: tuple[Any, ...]
+
+    if value.is_qnan() or value.is_snan():
+        digits = value.as_tuple().digits
+        payload = int("".join(map(str, digits))) if digits else 0
+        nan_class = 4 if value.is_qnan() else 3
+        key = (nan_class, decimal.Decimal(payload), 0)
+    elif value.is_infinite():
+        key = (2, decimal.Decimal(0), 0)
+    else:
+        t = value.as_tuple()
+        assert isinstance(t.exponent, int)
+        key = (1, value.copy_abs(), t.exponent)
+
+    if magnitude or not value.is_signed():
+        return key
+
+    return (-key[0], key[1].copy_negate(), -key[2])
+
+
+def _quiet(d: Decimal) -> Decimal:
+    "sNaN -> NaN with the same sign and payload."
+    if not d.value.is_snan():
+        return d
+
+    t = d.value.as_tuple()
+    return Decimal(decimal.Decimal((t.sign, t.digits, "n")))
+
+
+def _check(
+    operation: str,
+    lhs: Decimal,
+    rhs: Decimal,
+    result: "str | Decimal",
+    flags: FlagMask,
+    expected: "str | Decimal",
+    expected_flags: FlagMask,
+):
+    message = f"{operation}({lhs}, {rhs})"
+    check_result(message, result, flags, expected, expected_flags)
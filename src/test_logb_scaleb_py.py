@@ -1,13 +1,29 @@
-import os
 from common import (
     DECIMALS,
     ROUNDINGS,
+    ROUNDING_UP,
+    ROUNDING_DOWN,
     ROUNDING_TO_ZERO,
+    ROUNDING_TO_NEAREST_OR_EVEN,
+    ROUNDING_TO_NEAREST_OR_AWAY_FROM_ZERO,
     FLAG_INVALID_OPERATION,
     FLAG_DIVISION_BY_ZERO,
+    MASK_INEXACT,
+    MASK_UNDERFLOW,
+    MASK_SUBNORMAL,
+    MASK_INVALID_OPERATION,
     Context,
     Decimal,
-    write_line,
+    DecimalTuple,
+    FlagMask,
+    Rounding,
+    Task,
+    apply_all_roundings,
+    check_result,
+    finite_decimal,
+    is_oracle_checked,
+    open_fused_lines,
+    open_lines,
     random_ints,
     round_infinitely_big_value,
     round_infinitely_small_value,
@@ -27,68 +43,107 @@ INT64_MAX = 9223372036854775807
 INT64_MIN = -9223372036854775808
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
     for ctx in DECIMALS:
-        _write_logb(dir, ctx)
-        _write_scaleb(dir, ctx)
+        file_name = f"logb_{ctx.file_header}.txt"
+        result.append(Task(file_name, _write_logb, (ctx,)))
+
+        # All roundings in a single pass over the operands.
+        file_names = [
+            f"scaleb_{ctx.file_header}_{rounding.swift_name}.txt"
+            for rounding in ROUNDINGS
+        ]
+        task = Task(
+            file_names[0],
+            _write_scaleb,
+            (ctx, ROUNDINGS),
+            fused_file_names=tuple(file_names[1:]),
+        )
+        result.append(task)
 
+    return result
 
-def _write_logb(dir: str, ctx: Context):
-    operation = "logb"
-    decimals = ctx.generate(LOGB_DECIMAL_COUNT, seed=SEED)
 
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
+def _write_logb(path: str, ctx: Context):
+    operation = "logb"
 
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    ctx = ctx.copy(rounding)
+    decimals = ctx.generate_iter(LOGB_DECIMAL_COUNT, seed=SEED)
 
-    with open(path, "w") as f:
-        for d in decimals:
-            ctx.flags.clear_all()
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for index, d in enumerate(decimals):
+            t = d.as_tuple()
+            result: int | str
+            flags: FlagMask = 0
 
-            # In Python 'logb' is floating point -> raise 'div0' for 0.
             # In Swift 'logb' is an 'Int' -> raise IO for NaN, Inf and 0.
-            result_decimal = ctx_python.logb(d.value)
-            result_int = ""
-
-            if ctx_python.is_infinite(d.value):
-                result_int = "max"
-                ctx.flags.set(FLAG_INVALID_OPERATION)
-            elif ctx_python.is_nan(d.value):
-                result_int = "max"
-                ctx.flags.set(FLAG_INVALID_OPERATION)
-            elif ctx_python.is_zero(d.value):
-                result_int = "min"
-                ctx.flags.set(FLAG_INVALID_OPERATION)
-                # When exponent is 'Int' this exception should not be raised.
-                ctx.flags.clear(FLAG_DIVISION_BY_ZERO)
+            if t is None:
+                result = "max"
+                flags = MASK_INVALID_OPERATION
+            elif t.significand == 0:
+                result = "min"
+                flags = MASK_INVALID_OPERATION
             else:
-                r = Decimal(result_decimal)
-                t = r.as_tuple()
-                assert t is not None
-                assert t.exponent == 0
-                result_int = str(-t.significand if t.is_negative else t.significand)
+                result = t.exponent + len(str(t.significand)) - 1
 
-            ctx.flags.assert_empty(excluding=FLAG_INVALID_OPERATION)
+            if is_oracle_checked(ctx, index, index):
+                expected, expected_flags = _apply_logb(ctx, d)
+                message = f"{operation}({d})"
+                check_result(message, result, flags, expected, expected_flags)
 
-            write_line(
-                f,
-                context=ctx,
-                operation=operation,
-                rounding=rounding,
-                arguments=[d],
-                expected=result_int,
-            )
+            lines.append([d], result, flags)
 
 
-def _write_scaleb(dir: str, ctx: Context):
+def _apply_logb(ctx: Context, d: Decimal) -> tuple[int | str, FlagMask]:
+    ctx_python = ctx._python_context
+    ctx.flags.clear_all()
+
+    # In Python 'logb' is floating point -> raise 'div0' for 0.
+    # In Swift 'logb' is an 'Int' -> raise IO for NaN, Inf and 0.
+    result_decimal = ctx_python.logb(d.value)
+    result_int: int | str
+
+    if ctx_python.is_infinite(d.value):
+        result_int = "max"
+        ctx.flags.set(FLAG_INVALID_OPERATION)
+    elif ctx_python.is_nan(d.value):
+        result_int = "max"
+        ctx.flags.set(FLAG_INVALID_OPERATION)
+    elif ctx_python.is_zero(d.value):
+        result_int = "min"
+        ctx.flags.set(FLAG_INVALID_OPERATION)
+        # When exponent is 'Int' this exception should not be raised.
+        ctx.flags.clear(FLAG_DIVISION_BY_ZERO)
+    else:
+        r = Decimal(result_decimal)
+        t = r.as_tuple()
+        assert t is not None
+        assert t.exponent == 0
+        result_int = -t.significand if t.is_negative else t.significand
+
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(excluding=MASK_INVALID_OPERATION, snapshot=flags)
+
+    return result_int, flags
+
+
+def _write_scaleb(
+    paths: list[str],
+    ctx: Context,
+    roundings: tuple[Rounding, ...],
+):
     operation = "scaleb"
-    decimals = ctx.generate(SCALEB_DECIMAL_COUNT, seed=SEED)
+
+    # The most important line:
+    contexts = [ctx.copy(rounding) for rounding in roundings]
+    files = [(c, operation, r) for c, r in zip(contexts, roundings)]
+    ctx = contexts[0]
     ctx_python = ctx._python_context
+    decimals = list(ctx.generate(SCALEB_DECIMAL_COUNT, seed=SEED))
 
     exponents: list[int] = [
         ctx_python.Emin,
@@ -128,70 +183,206 @@ def _write_scaleb(dir: str, ctx: Context):
         )
     )
 
-    for rounding in ROUNDINGS:
-        file_name = f"{operation}_{ctx.file_header}_{rounding.swift_name}.txt"
-        path = os.path.join(dir, file_name)
-        print(file_name)
-
-        # The most important line:
-        ctx_python.rounding = rounding.python
-
-        with open(path, "w") as f:
-            for d in decimals:
-                for e in exponents:
-                    ctx.flags.clear_all()
-
-                    result: Decimal | str
-
-                    if ctx_python.is_snan(d.value):
-                        # Swift is 'ok' with sNaN
-                        result = d
-                    elif ctx_python.is_infinite(d.value):
-                        # Python returns NaN
-                        result = d
-                    elif ctx_python.is_zero(d.value):
-                        # Python returns NaN
-                        t = d.as_tuple()
-                        assert t is not None
-                        new_exponent = t.exponent + e
-
-                        # Clamp between min/max.
-                        t.exponent = min(
-                            ctx.max_signed_exponent,
-                            max(ctx.min_signed_exponent, new_exponent),
-                        )
-
-                        result = Decimal.from_tuple(ctx, t)
-                    else:
-                        # Python returns NaN with IO for underflow/overflow.
-                        r = ctx_python.scaleb(d.value, e)
-                        # No 'ctx.flags.assert_empty', because a lot of them may fire.
-
-                        if ctx.flags.is_set(FLAG_INVALID_OPERATION):
-                            ctx.flags.clear(FLAG_INVALID_OPERATION)
-
-                            t = d.as_tuple()
-                            assert t is not None
-                            new_exponent = t.exponent + e
-
-                            if new_exponent > 0:
-                                result = round_infinitely_big_value(ctx, d, rounding)
-                            else:
-                                result = round_infinitely_small_value(
-                                    ctx,
-                                    d,
-                                    rounding,
-                                    preferred_exponent_for_zero=ctx.min_signed_exponent,
-                                )
-
-                        else:
-                            result = Decimal(r)
-
-                    write_line(
-                        f,
-                        context=ctx,
-                        operation=operation,
-                        rounding=rounding,
-                        arguments=[d, e],
-                        expected=result,
-                    )
+    exponent_count = len(exponents)
+
+    with open_fused_lines(paths, files) as writers:
+        for d_index, d in enumerate(decimals):
+            for e_index, e in enumerate(exponents):
+                results = apply_all_roundings(contexts, lambda c: _scaleb(c, d, e))
+
+                pair_index = d_index * exponent_count + e_index
+                if is_oracle_checked(ctx, pair_index, d_index):
+                    for c, (result, flags) in zip(contexts, results):
+                        expected, expected_flags = _apply_scaleb(c, d, e)
+                        message = f"{operation}({d}, {e}, {c.rounding})"
+                        check_result(message, result, flags, expected, expected_flags)
+
+                for lines, (result, flags) in zip(writers, results):
+                    lines.append([d, e], result, flags)
+
+
+def _scaleb(ctx: Context, d: Decimal, e: int) -> tuple[Decimal | str, FlagMask]:
+    t = d.as_tuple()
+
+    if t is None:
+        # Swift is 'ok' with sNaN, Python returns NaN for infinity.
+        return d, 0
+
+    exponent = t.exponent + e
+
+    if t.significand == 0:
+        # Clamp between min/max.
+        exponent = min(
+            ctx.max_signed_exponent,
+            max(ctx.min_signed_exponent, exponent),
+        )
+        return finite_decimal(t.is_negative, 0, exponent), 0
+
+    # Python returns NaN with IO if the exponent is outside of this range.
+    max_jump = 2 * (ctx._python_context.Emax + ctx.precision)
+
+    if -max_jump <= e <= max_jump:
+        return _fix(ctx, d, t.is_negative, t.significand, exponent)
+
+    ctx.flags.clear_all()
+    result: Decimal | str
+
+    if exponent > 0:
+        result = round_infinitely_big_value(ctx, d, ctx.rounding)
+    else:
+        result = round_infinitely_small_value(
+            ctx,
+            d,
+            ctx.rounding,
+            preferred_exponent_for_zero=ctx.min_signed_exponent,
+        )
+
+    return result, ctx.flags.snapshot()
+
+
+def _fix(
+    ctx: Context,
+    d: Decimal,
+    is_negative: bool,
+    significand: int,
+    exponent: int,
+) -> tuple[Decimal | str, FlagMask]:
+    """
+    Round finite non-zero value to 'ctx' (the same as 'decimal' does after every
+    operation). 'd' is only used for its sign in case of overflow.
+    """
+    precision = ctx.precision
+    digit_count = len(str(significand))
+    # Exponent if we used all of the 'precision' digits.
+    exponent_min = digit_count + exponent - precision
+
+    if exponent_min > ctx.max_signed_exponent:
+        return _overflow(ctx, d)
+
+    flags: FlagMask = 0
+    is_subnormal = exponent_min < ctx.min_signed_exponent
+
+    if is_subnormal:
+        flags |= MASK_SUBNORMAL
+        exponent_min = ctx.min_signed_exponent
+
+    if exponent >= exponent_min:
+        # Exact, but with clamp=1 big exponent is folded down by adding zeros.
+        if exponent > ctx.max_signed_exponent:
+            significand *= 10 ** (exponent - ctx.max_signed_exponent)
+            exponent = ctx.max_signed_exponent
+
+        return finite_decimal(is_negative, significand, exponent), flags
+
+    # Removing more than 'digit_count + 1' digits does not change anything: the
+    # quotient is 0 and the remainder is less than a half.
+    shift = min(exponent_min - exponent, digit_count + 1)
+    unit = 10**shift
+    quotient, remainder = divmod(significand, unit)
+
+    if remainder:
+        flags |= MASK_INEXACT
+
+        if is_subnormal:
+            flags |= MASK_UNDERFLOW
+
+        if _is_rounded_away(ctx.rounding, is_negative, quotient, remainder, unit):
+            quotient += 1
+
+            if quotient == ctx.max_decimal_digits + 1:
+                quotient //= 10
+                exponent_min += 1
+
+                if exponent_min > ctx.max_signed_exponent:
+                    return _overflow(ctx, d)
+
+    return finite_decimal(is_negative, quotient, exponent_min), flags
+
+
+def _is_rounded_away(
+    rounding: Rounding,
+    is_negative: bool,
+    quotient: int,
+    remainder: int,
+    unit: int,
+) -> bool:
+    "Should the magnitude be incremented? 'remainder' is not 0."
+    if rounding == ROUNDING_UP:
+        return not is_negative
+
+    if rounding == ROUNDING_DOWN:
+        return is_negative
+
+    if rounding == ROUNDING_TO_NEAREST_OR_EVEN:
+        double = 2 * remainder
+        return double > unit or (double == unit and quotient % 2 == 1)
+
+    if rounding == ROUNDING_TO_NEAREST_OR_AWAY_FROM_ZERO:
+        return 2 * remainder >= unit
+
+    return False
+
+
+def _overflow(ctx: Context, d: Decimal) -> tuple[Decimal | str, FlagMask]:
+    ctx.flags.clear_all()
+    result = round_infinitely_big_value(ctx, d, ctx.rounding)
+    return result, ctx.flags.snapshot()
+
+
+def _apply_scaleb(
+    ctx: Context,
+    d: Decimal,
+    e: int,
+) -> tuple[Decimal | str, FlagMask]:
+    ctx_python = ctx._python_context
+    rounding = ctx.rounding
+    ctx.flags.clear_all()
+
+    result: Decimal | str
+
+    if ctx_python.is_snan(d.value):
+        # Swift is 'ok' with sNaN
+        result = d
+    elif ctx_python.is_infinite(d.value):
+        # Python returns NaN
+        result = d
+    elif ctx_python.is_zero(d.value):
+        # Python returns NaN
+        t = d.as_tuple()
+        assert t is not None
+        new_exponent = t.exponent + e
+
+        # Clamp between min/max.
+        exponent = min(
+            ctx.max_signed_exponent,
+            max(ctx.min_signed_exponent, new_exponent),
+        )
+
+        t = DecimalTuple(t.is_negative, t.significand, exponent)
+        result = Decimal.from_tuple(ctx, t)
+    else:
+        # Python returns NaN with IO for underflow/overflow.
+        r = ctx_python.scaleb(d.value, e)
+        # No 'ctx.flags.assert_empty', because a lot of them may fire.
+
+        if ctx.flags.is_set(FLAG_INVALID_OPERATION):
+            ctx.flags.clear(FLAG_INVALID_OPERATION)
+
+            t = d.as_tuple()
+            assert t is not None
+            new_exponent = t.exponent + e
+
+            if new_exponent > 0:
+                result = round_infinitely_big_value(ctx, d, rounding)
+            else:
+                result = round_infinitely_small_value(
+                    ctx,
+                    d,
+                    rounding,
+                    preferred_exponent_for_zero=ctx.min_signed_exponent,
+                )
+
+        else:
+            result = Decimal(r)
+
+    return result, ctx.flags.snapshot()
@@ -1,64 +1,75 @@
-import os
 import decimal
-from typing import Callable
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
-    FLAG_SUBNORMAL,
-    FLAG_INVALID_OPERATION,
+    MASK_SUBNORMAL,
+    MASK_INVALID_OPERATION,
     Context,
-    Decimal,
-    FlagType,
-    write_line,
+    FlagMask,
+    Task,
+    UnaryOperation,
+    check_oracle,
+    is_oracle_checked,
+    next_down,
+    next_up,
+    open_fused_lines,
 )
 
 SEED = 8861684681
 DECIMAL_COUNT = 50_000
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
+    # Both are written in a single pass over the operands.
+    operations: tuple[UnaryOperation, ...] = (
+        ("next_up", next_up, decimal.Context.next_plus),
+        ("next_down", next_down, decimal.Context.next_minus),
+    )
+    names = [operation for operation, _, _ in operations]
+
     for ctx in DECIMALS:
-        ds = ctx.generate(DECIMAL_COUNT, seed=SEED)
-        _write_file(dir, ctx, ds, "next_up", lambda ctx, d: ctx.next_plus(d))
-        _write_file(dir, ctx, ds, "next_down", lambda ctx, d: ctx.next_minus(d))
+        file_names = [f"{name}_{ctx.file_header}.txt" for name in names]
+        task = Task(
+            file_names[0],
+            _write_files,
+            (ctx, operations),
+            fused_file_names=tuple(file_names[1:]),
+        )
+        result.append(task)
 
+    return result
 
-def _write_file(
-    dir: str,
+
+def _write_files(
+    paths: list[str],
     ctx: Context,
-    decimals: list[Decimal],
-    operation: str,
-    apply: Callable[[decimal.Context, decimal.Decimal], decimal.Decimal],
+    operations: tuple[UnaryOperation, ...],
 ):
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    ctx = ctx.copy(rounding)
+    decimals = ctx.generate_iter(DECIMAL_COUNT, seed=SEED)
+    names = [operation for operation, _, _ in operations]
 
-    with open(path, "w") as f:
-        for d in decimals:
-            ctx.flags.clear_all()
-            result = apply(ctx_python, d.value)
+    files = [(ctx, name, rounding) for name in names]
 
-            excluded_flags: list[FlagType] = []
+    with open_fused_lines(paths, files) as writers:
+        for index, d in enumerate(decimals):
+            is_checked = is_oracle_checked(ctx, index, index)
+            excluded_flags: FlagMask = MASK_SUBNORMAL
 
-            if ctx_python.is_snan(d.value):
-                excluded_flags.append(FLAG_INVALID_OPERATION)
+            if is_checked and d.value.is_snan():
+                excluded_flags |= MASK_INVALID_OPERATION
 
-            if ctx_python.is_subnormal(result):
-                excluded_flags.append(FLAG_SUBNORMAL)
+            for (name, apply, oracle), lines in zip(operations, writers):
+                result, flags = apply(ctx, d)
 
-            ctx.flags.assert_empty(excluding=excluded_flags)
+                if is_checked:
+                    message = f"{name}({d})"
+                    check_oracle(
+                        message, result, flags, ctx, oracle, d, excluding=excluded_flags
+                    )
 
-            write_line(
-                f,
-                context=ctx,
-                operation=operation,
-                rounding=rounding,
-                arguments=[d],
-                expected=Decimal(result),
-            )
+                lines.append([d], result, flags)
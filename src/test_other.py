@@ -1,10 +1,16 @@
-import os
+import decimal
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
+    Chunk,
     Context,
-    Decimal,
-    write_line,
+    FlagMask,
+    Task,
+    check_oracle,
+    is_negative,
+    is_oracle_checked,
+    open_lines,
+    with_sign,
 )
 
 SEED = 5191561918
@@ -12,36 +18,43 @@ SEED = 5191561918
 COPY_SIGN_COUNT = 150
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
     for ctx in DECIMALS:
-        _write_copy_sign(dir, ctx)
+        file_name = f"copy_sign_{ctx.file_header}.txt"
+        result.append(Task(file_name, _write_copy_sign, (ctx,), is_chunked=True))
+
+    return result
 
 
-def _write_copy_sign(dir: str, ctx: Context):
+def _write_copy_sign(path: str, ctx: Context, chunk: Chunk):
     operation = "copy_sign"
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
 
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
-
-    decimals = ctx.generate(COPY_SIGN_COUNT, seed=SEED)
-
-    with open(path, "w") as f:
-        for lhs in decimals:
-            for rhs in decimals:
-                ctx.flags.clear_all()
-                result = ctx_python.copy_sign(lhs.value, rhs.value)
-                ctx.flags.assert_empty()
-
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[lhs, rhs],
-                    expected=Decimal(result),
-                )
+    ctx = ctx.copy(rounding)
+
+    decimals = list(ctx.generate(COPY_SIGN_COUNT, seed=SEED))
+    decimal_count = len(decimals)
+    lhs_indices = chunk.take(list(range(decimal_count)))
+    signs = [is_negative(d) for d in decimals]
+
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for lhs_index in lhs_indices:
+            lhs = decimals[lhs_index]
+            # Both signs, so that we do not create the same values over and over.
+            results = (with_sign(lhs, False), with_sign(lhs, True))
+
+            for rhs_index, rhs in enumerate(decimals):
+                # Copies do not signal.
+                flags: FlagMask = 0
+                result = results[signs[rhs_index]]
+
+                pair_index = lhs_index * decimal_count + rhs_index
+                if is_oracle_checked(ctx, pair_index, lhs_index, rhs_index):
+                    message = f"{operation}({lhs}, {rhs})"
+                    oracle = decimal.Context.copy_sign
+                    check_oracle(message, result, flags, ctx, oracle, lhs, rhs)
+
+                lines.append([lhs, rhs], result, flags)
@@ -1,77 +1,153 @@
-import os
 import decimal
 from typing import Callable
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
-    FLAG_SUBNORMAL,
+    MASK_SUBNORMAL,
     Context,
     Decimal,
-    write_line,
+    FlagMask,
+    LineWriter,
+    Task,
+    check_oracle,
+    is_negative,
+    is_normal,
+    is_oracle_checked,
+    is_subnormal,
+    open_fused_lines,
 )
 
 SEED = 1238488
 DECIMAL_COUNT = 20_000
 SUBNORMAL_DECIMAL_COUNT = 5_000
 
+Predicate = Callable[[Context, Decimal], bool]
+Oracle = Callable[[decimal.Context, decimal.Decimal], bool]
 
-def write(dir: str):
-    for ctx in DECIMALS:
-        ds = ctx.generate(DECIMAL_COUNT, seed=SEED)
+Operation = tuple[str, Predicate, Oracle, bool]
+"Name, function, 'decimal' oracle, 'with_subnormals'."
 
-        # Subnormal = normal + a few more
-        ds_subnormal = list(ds)
-        ds_subnormal.extend(ctx.generate_subnormals(SUBNORMAL_DECIMAL_COUNT, seed=SEED))
-
-        _write_file(dir, ctx, ds, "is_zero", lambda ctx, d: ctx.is_zero(d))
-        _write_file(dir, ctx, ds, "is_finite", lambda ctx, d: ctx.is_finite(d))
-        _write_file(dir, ctx, ds, "is_infinite", lambda ctx, d: ctx.is_infinite(d))
-        _write_file(dir, ctx, ds, "is_nan", lambda ctx, d: ctx.is_nan(d))
-        _write_file(dir, ctx, ds, "is_qnan", lambda ctx, d: ctx.is_qnan(d))
-        _write_file(dir, ctx, ds, "is_snan", lambda ctx, d: ctx.is_snan(d))
-        _write_file(dir, ctx, ds, "is_normal", lambda ctx, d: ctx.is_normal(d))
-        _write_file(dir, ctx, ds, "is_negative", lambda ctx, d: ctx.is_signed(d))
-
-        _write_file(
-            dir, ctx, ds_subnormal, "is_subnormal", lambda ctx, d: ctx.is_subnormal(d)
-        )
 
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
+    # All of them are written in a single pass over the operands.
+    operations: tuple[Operation, ...] = (
+        ("is_zero", _is_zero, decimal.Context.is_zero, False),
+        ("is_finite", _is_finite, decimal.Context.is_finite, False),
+        ("is_infinite", _is_infinite, decimal.Context.is_infinite, False),
+        ("is_nan", _is_nan, decimal.Context.is_nan, False),
+        ("is_qnan", _is_qnan, decimal.Context.is_qnan, False),
+        ("is_snan", _is_snan, decimal.Context.is_snan, False),
+        ("is_normal", is_normal, decimal.Context.is_normal, False),
+        ("is_negative", _is_negative, decimal.Context.is_signed, False),
+        ("is_subnormal", is_subnormal, decimal.Context.is_subnormal, True),
         # This test is not the best because in Python all decimals are canonical:
         #   canonical()
         #   Return the canonical encoding of the argument. Currently, the encoding
         #   of a Decimal instance is always canonical, so this operation returns
         #   its argument unchanged.
         #   https://docs.python.org/3/library/decimal.html#decimal.Decimal.canonical
-        _write_file(dir, ctx, ds, "is_canonical", lambda ctx, d: ctx.is_canonical(d))
+        ("is_canonical", _is_canonical, decimal.Context.is_canonical, False),
+    )
+    names = [operation for operation, _, _, _ in operations]
 
+    for ctx in DECIMALS:
+        file_names = [f"{name}_{ctx.file_header}.txt" for name in names]
+        task = Task(
+            file_names[0],
+            _write_files,
+            (ctx, operations),
+            fused_file_names=tuple(file_names[1:]),
+        )
+        result.append(task)
+
+    return result
 
-def _write_file(
-    dir: str,
+
+def _write_files(
+    paths: list[str],
     ctx: Context,
-    decimals: list[Decimal],
-    operation: str,
-    apply: Callable[[decimal.Context, decimal.Decimal], bool],
+    operations: tuple[Operation, ...],
 ):
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
-
-    with open(path, "w") as f:
-        for d in decimals:
-            ctx.flags.clear_all()
-            result = apply(ctx_python, d.value)
-            ctx.flags.assert_empty(excluding=FLAG_SUBNORMAL)
-
-            write_line(
-                f,
-                context=ctx,
-                operation=operation,
-                rounding=rounding,
-                arguments=[d],
-                expected=result,
-            )
+    ctx = ctx.copy(rounding)
+    names = [operation for operation, _, _, _ in operations]
+
+    files = [(ctx, name, rounding) for name in names]
+
+    with open_fused_lines(paths, files) as writers:
+        all_writers = list(zip(operations, writers))
+        subnormal_writers = [
+            (operation, lines)
+            for operation, lines in zip(operations, writers)
+            if operation[3]
+        ]
+
+        def write(
+            d: Decimal,
+            is_checked: bool,
+            writers: list[tuple[Operation, LineWriter]],
+        ):
+            # Predicates do not signal.
+            flags: FlagMask = 0
+
+            for (name, apply, oracle, _), lines in writers:
+                result = apply(ctx, d)
+
+                if is_checked:
+                    message = f"{name}({d})"
+                    check_oracle(
+                        message, result, flags, ctx, oracle, d, excluding=MASK_SUBNORMAL
+                    )
+
+                lines.append([d], result, flags)
+
+        for index, d in enumerate(ctx.generate_iter(DECIMAL_COUNT, seed=SEED)):
+            is_checked = is_oracle_checked(ctx, index, index)
+            write(d, is_checked, all_writers)
+
+        # Subnormal = normal + a few more
+        if subnormal_writers:
+            count = SUBNORMAL_DECIMAL_COUNT
+            subnormals = ctx.generate_subnormals_iter(count, seed=SEED)
+
+            for index, d in enumerate(subnormals):
+                is_checked = is_oracle_checked(ctx, index)
+                write(d, is_checked, subnormal_writers)
+
+
+def _is_zero(ctx: Context, d: Decimal) -> bool:
+    t = d.as_tuple()
+    return t is not None and t.significand == 0
+
+
+def _is_finite(ctx: Context, d: Decimal) -> bool:
+    return d.as_tuple() is not None
+
+
+# Non-finite values use 'decimal.Decimal' predicates, they do not need the context.
+def _is_infinite(ctx: Context, d: Decimal) -> bool:
+    return d.as_tuple() is None and d.value.is_infinite()
+
+
+def _is_nan(ctx: Context, d: Decimal) -> bool:
+    return d.as_tuple() is None and d.value.is_nan()
+
+
+def _is_qnan(ctx: Context, d: Decimal) -> bool:
+    return d.as_tuple() is None and d.value.is_qnan()
+
+
+def _is_snan(ctx: Context, d: Decimal) -> bool:
+    return d.as_tuple() is None and d.value.is_snan()
+
+
+def _is_negative(ctx: Context, d: Decimal) -> bool:
+    return is_negative(d)
+
+
+def _is_canonical(ctx: Context, d: Decimal) -> bool:
+    # All values are canonical.
+    return True
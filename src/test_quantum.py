@@ -1,19 +1,32 @@
-import os
+from bisect import bisect_right
 from common import (
     DECIMALS,
     ROUNDINGS,
     ROUNDING_TO_ZERO,
-    FLAG_INEXACT,
-    FLAG_SUBNORMAL,
-    FLAG_INVALID_OPERATION,
+    MASK_INEXACT,
+    MASK_SUBNORMAL,
+    MASK_INVALID_OPERATION,
+    Chunk,
     Context,
     Decimal,
-    FlagType,
-    write_line,
+    FlagMask,
+    Rounding,
+    Task,
+    apply_all_roundings,
+    open_fused_lines,
+    open_lines,
 )
 
 DECIMAL_COUNT = 300  # + common_precisions, and then cartesian product for all roundings
 
+# 'quantize' does not use the whole cartesian product. For every operand we take
+# at most this many precisions from each outcome class (invalid, exact, rounded),
+# see '_select_precisions' for details.
+QUANTIZE_CLASS_QUOTA = 16
+# NaN and infinity precisions per operand (part of the 'invalid' quota). They are
+# rotated between the operands, so that all of them are used.
+QUANTIZE_SPECIAL_QUOTA = 2
+
 # Quantize is important, so it will have multiple files.
 # This will also make tests more 'parallel'.
 SEEDS: tuple[int, ...] = (
@@ -24,151 +37,259 @@ SEEDS: tuple[int, ...] = (
 )
 
 
-def write(dir: str):
-    for ctx in DECIMALS:
-        common_precisions: list[Decimal] = []
-
-        # 1000000000000000
-        # 100000000000000
-        # 10000000000000
-        # …
-        # 1
-        for digit_count in range(ctx.precision, 0, -1):
-            zero_count = digit_count - 1
-            zeros = "0" * zero_count
+def tasks() -> list[Task]:
+    result: list[Task] = []
 
+    for ctx in DECIMALS:
+        for file_index, seed in enumerate(SEEDS):
+            # All roundings in a single pass over the operands.
+            # 'towardZero' goes first, see '_write_quantize' for details.
+            roundings = (ROUNDING_TO_ZERO,) + tuple(
+                r for r in ROUNDINGS if r != ROUNDING_TO_ZERO
+            )
+            file_names = [
+                f"quantize_{ctx.file_header}_{rounding.swift_name}_{file_index}.txt"
+                for rounding in roundings
+            ]
+            task = Task(
+                file_names[0],
+                _write_quantize,
+                (ctx, seed, roundings),
+                is_chunked=True,
+                fused_file_names=tuple(file_names[1:]),
+            )
+            result.append(task)
+
+            file_name = f"same_quantum_{ctx.file_header}_{file_index}.txt"
+            task = Task(file_name, _write_same_quantum, (ctx, seed), is_chunked=True)
+            result.append(task)
+
+    return result
+
+
+def _generate_decimals(ctx: Context, seed: int) -> list[Decimal]:
+    common_precisions: list[Decimal] = []
+
+    # 1000000000000000
+    # 100000000000000
+    # 10000000000000
+    # …
+    # 1
+    for digit_count in range(ctx.precision, 0, -1):
+        zero_count = digit_count - 1
+        zeros = "0" * zero_count
+
+        ctx.flags.clear_all()
+        s = "1" + zeros
+        d = ctx._python_context.create_decimal(s)
+        ctx.flags.assert_empty()
+
+        common_precisions.append(Decimal(d.copy_abs()))
+        common_precisions.append(Decimal(d.copy_negate()))
+
+    # 0.1
+    # 0.01
+    # 0.001
+    # 0.0001
+    # 0.00001
+    for zero_count in range(ctx.precision - 1):
+        zeros = "0" * zero_count
+
+        for trailing__digit in ("1", "0"):
             ctx.flags.clear_all()
-            s = "1" + zeros
+            s = "0." + zeros + trailing__digit
             d = ctx._python_context.create_decimal(s)
             ctx.flags.assert_empty()
 
             common_precisions.append(Decimal(d.copy_abs()))
             common_precisions.append(Decimal(d.copy_negate()))
 
-        # 0.1
-        # 0.01
-        # 0.001
-        # 0.0001
-        # 0.00001
-        for zero_count in range(ctx.precision - 1):
-            zeros = "0" * zero_count
-
-            for trailing__digit in ("1", "0"):
-                ctx.flags.clear_all()
-                s = "0." + zeros + trailing__digit
-                d = ctx._python_context.create_decimal(s)
-                ctx.flags.assert_empty()
-
-                common_precisions.append(Decimal(d.copy_abs()))
-                common_precisions.append(Decimal(d.copy_negate()))
-
-        for file_index, seed in enumerate(SEEDS):
-            decimals = ctx.generate(DECIMAL_COUNT, seed=seed)
-
-            # Insert common just after special values
-            special_end_index = -1
+    decimals = list(ctx.generate(DECIMAL_COUNT, seed=seed))
 
-            for index, d in enumerate(decimals):
-                is_special = (
-                    ctx._python_context.is_nan(d.value)
-                    or ctx._python_context.is_infinite(d.value)
-                    or ctx._python_context.is_zero(d.value)
-                )
+    # Insert common just after special values
+    special_end_index = -1
 
-                if not is_special:
-                    special_end_index = index
-                    break
+    for index, d in enumerate(decimals):
+        is_special = (
+            ctx._python_context.is_nan(d.value)
+            or ctx._python_context.is_infinite(d.value)
+            or ctx._python_context.is_zero(d.value)
+        )
 
-            special = decimals[:special_end_index]
-            after_special = decimals[special_end_index:]
-            decimals = special + common_precisions + after_special
+        if not is_special:
+            special_end_index = index
+            break
 
-            _write_quantize(dir, ctx, file_index, decimals)
-            _write_same_quantum(dir, ctx, file_index, decimals)
+    special = decimals[:special_end_index]
+    after_special = decimals[special_end_index:]
+    return special + common_precisions + after_special
 
 
 def _write_quantize(
-    dir: str,
+    paths: list[str],
     ctx: Context,
-    file_index: int,
-    decimals: list[Decimal],
+    seed: int,
+    roundings: tuple[Rounding, ...],
+    chunk: Chunk,
 ):
     operation = "quantize"
-    ctx_python = ctx._python_context
 
-    for rounding in ROUNDINGS:
-        file_name = (
-            f"{operation}_{ctx.file_header}_{rounding.swift_name}_{file_index}.txt"
-        )
-        path = os.path.join(dir, file_name)
-        print(file_name)
+    # The most important line:
+    contexts = [ctx.copy(rounding) for rounding in roundings]
+    files = [(c, operation, r) for c, r in zip(contexts, roundings)]
+    decimals = _generate_decimals(contexts[0], seed)
+
+    # 'invalidOperation' means that the result does not fit. 'towardZero' never
+    # increases the magnitude, so if it does not fit then it will not fit for any
+    # other rounding. This is the most common result.
+    assert roundings[0] == ROUNDING_TO_ZERO
+
+    index = _PrecisionIndex(contexts[0], decimals)
+
+    with open_fused_lines(paths, files) as writers:
+        for row in chunk.take(list(range(len(decimals)))):
+            d = decimals[row]
 
-        # The most important line:
-        ctx_python.rounding = rounding.python
+            for precision in _select_precisions(index, row, d):
+                results = apply_all_roundings(
+                    contexts,
+                    lambda c: _quantize(c, d, precision),
+                    rounding_dependent=MASK_INEXACT,
+                )
 
-        with open(path, "w") as f:
-            for d in decimals:
-                for precision in decimals:
-                    ctx.flags.clear_all()
+                for lines, (result, flags) in zip(writers, results):
+                    lines.append([d, precision], result, flags)
+
+
+class _PrecisionIndex:
+    "'quantize' precision operands sorted by exponent."
+
+    def __init__(self, ctx: Context, decimals: list[Decimal]) -> None:
+        self.ctx = ctx
+        self.decimals = decimals
+        self.special_indices: list[int] = []
+        "Infinities and NaNs, always included."
+        self.finite_indices: list[int] = []
+        "Sorted by exponent, the same exponent in the original order."
+        self.exponents: list[int] = []
+        "Exponents of the 'finite_indices' for 'bisect'."
+
+        finite: list[tuple[int, int]] = []
+
+        for i, d in enumerate(decimals):
+            if d.value.is_finite():
+                exponent = d.value.as_tuple().exponent
+                assert isinstance(exponent, int)
+                finite.append((exponent, i))
+            else:
+                self.special_indices.append(i)
+
+        finite.sort()
+        self.finite_indices = [i for _, i in finite]
+        self.exponents = [e for e, _ in finite]
+
+
+def _select_precisions(index: _PrecisionIndex, row: int, d: Decimal) -> list[Decimal]:
+    """
+    Precisions for 'quantize(d, precision)' in the original order.
+
+    Finite precisions are split by their exponent into outcome classes:
+    - invalid - result would have more than 'precision' digits
+    - exact - precision exponent <= 'd' exponent, no rounding
+    - rounded - precision exponent > 'd' exponent
+    For a subnormal 'd' the exact and rounded results are also subnormal.
+
+    Every class is represented by 'QUANTIZE_CLASS_QUOTA' evenly spaced precisions,
+    which includes the ones next to the class boundaries. NaN and infinity
+    precisions (invalid or NaN result) are taken from the 'invalid' quota.
+    """
+    ctx = index.ctx
+    quota = QUANTIZE_CLASS_QUOTA
+    indices = index.finite_indices
+    exponents = index.exponents
+
+    specials = index.special_indices
+    special_count = min(QUANTIZE_SPECIAL_QUOTA, len(specials))
+    selected = [specials[(row + i) % len(specials)] for i in range(special_count)]
+    invalid_quota = quota - special_count
+
+    if not d.value.is_finite():
+        # Invalid or NaN for every precision.
+        selected.extend(_spread(indices, invalid_quota))
+    elif d.value.is_zero():
+        # Exact for every precision.
+        selected.extend(_spread(indices, quota))
+    else:
+        t = d.value.as_tuple()
+        assert isinstance(t.exponent, int)
+        adjusted = d.value.adjusted()
+        invalid_end = bisect_right(exponents, adjusted - ctx.precision)
+        exact_end = bisect_right(exponents, t.exponent)
+        selected.extend(_spread(indices[:invalid_end], invalid_quota))
+        selected.extend(_spread(indices[invalid_end:exact_end], quota))
+        selected.extend(_spread(indices[exact_end:], quota))
+
+    selected.sort()
+    return [index.decimals[i] for i in selected]
+
+
+def _spread(items: list[int], count: int) -> list[int]:
+    "'count' evenly spaced items, including the first and the last one."
+    if len(items) <= count or count <= 1:
+        return items[:count]
+
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
+def _quantize(
+    ctx: Context,
+    d: Decimal,
+    precision: Decimal,
+) -> tuple[Decimal, FlagMask]:
+    ctx_python = ctx._python_context
+    ctx.flags.clear_all()
 
-                    result = ctx_python.quantize(d.value, precision.value)
+    result = ctx_python.quantize(d.value, precision.value)
 
-                    if ctx_python.is_nan(d.value):
-                        # If we have 'qNaN' and 'sNaN' in the same operation
-                        # then Python returns 'sNaN' sign, even if 'sNaN' is
-                        # the 'precision' argument.
-                        result = ctx_python.copy_sign(result, d.value)
+    if ctx_python.is_nan(d.value):
+        # If we have 'qNaN' and 'sNaN' in the same operation
+        # then Python returns 'sNaN' sign, even if 'sNaN' is
+        # the 'precision' argument.
+        result = ctx_python.copy_sign(result, d.value)
 
-                    excluded_flags: list[FlagType] = [
-                        FLAG_INEXACT,
-                        FLAG_INVALID_OPERATION,
-                    ]
+    excluded_flags: FlagMask = MASK_INEXACT | MASK_INVALID_OPERATION
 
-                    if ctx_python.is_subnormal(result):
-                        excluded_flags.append(FLAG_SUBNORMAL)
+    if ctx_python.is_subnormal(result):
+        excluded_flags |= MASK_SUBNORMAL
 
-                    ctx.flags.assert_empty(excluding=excluded_flags)
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(excluding=excluded_flags, snapshot=flags)
 
-                    write_line(
-                        f,
-                        context=ctx,
-                        operation=operation,
-                        rounding=rounding,
-                        arguments=[d, precision],
-                        expected=Decimal(result),
-                    )
+    return Decimal(result), flags
 
 
 def _write_same_quantum(
-    dir: str,
+    path: str,
     ctx: Context,
-    file_index: int,
-    decimals: list[Decimal],
+    seed: int,
+    chunk: Chunk,
 ):
     operation = "same_quantum"
 
-    file_name = f"{operation}_{ctx.file_header}_{file_index}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
+    ctx = ctx.copy(rounding)
     ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    decimals = _generate_decimals(ctx, seed)
 
-    with open(path, "w") as f:
-        for d in decimals:
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for d in chunk.take(decimals):
             for precision in decimals:
                 pass
                 ctx.flags.clear_all()
                 result = ctx_python.same_quantum(d.value, precision.value)
-                ctx.flags.assert_empty()
-
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[d, precision],
-                    expected=result,
-                )
+                flags = ctx.flags.snapshot()
+                ctx.flags.assert_empty(snapshot=flags)
+
+                lines.append([d, precision], result, flags)
@@ -1,15 +1,16 @@
-import os
 import decimal
-from typing import Callable
+from typing import Callable, Iterator
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
-    FLAG_SUBNORMAL,
-    FLAG_INVALID_OPERATION,
+    MASK_SUBNORMAL,
+    MASK_INVALID_OPERATION,
+    Chunk,
     Context,
     Decimal,
-    FlagType,
-    write_line,
+    FlagMask,
+    Task,
+    open_lines,
 )
 
 SEED = 6816518918
@@ -25,51 +26,27 @@ DECIMAL_BIG_REM_SMALL_COUNT = 1500
 DECIMAL_SMALL_REM_BIG_COUNT = 200
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
     for ctx in DECIMALS:
-        decimals = ctx.generate(DECIMAL_BIG_REM_SMALL_COUNT, seed=SEED)
-
-        _write_file(
-            dir,
-            ctx,
-            decimals,
-            operation="rem_near",
-            file_name="rem_near_big_small",
-            sort_operands=_big_rem_small,
-            apply=_remainder_near,
-        )
-
-        _write_file(
-            dir,
-            ctx,
-            decimals,
-            operation="rem_trunc",
-            file_name="rem_trunc_big_small",
-            sort_operands=_big_rem_small,
-            apply=_remainder_trunc,
-        )
-
-        decimals = ctx.generate(DECIMAL_SMALL_REM_BIG_COUNT, seed=SEED)
-
-        _write_file(
-            dir,
-            ctx,
-            decimals,
-            operation="rem_near",
-            file_name="rem_near_small_big",
-            sort_operands=_small_rem_big,
-            apply=_remainder_near,
-        )
-
-        _write_file(
-            dir,
-            ctx,
-            decimals,
-            operation="rem_trunc",
-            file_name="rem_trunc_small_big",
-            sort_operands=_small_rem_big,
-            apply=_remainder_trunc,
-        )
+        for count, file_name, sort_operands in (
+            (DECIMAL_BIG_REM_SMALL_COUNT, "big_small", _big_rem_small),
+            (DECIMAL_SMALL_REM_BIG_COUNT, "small_big", _small_rem_big),
+        ):
+            for operation, apply in (
+                ("rem_near", _remainder_near),
+                ("rem_trunc", _remainder_trunc),
+            ):
+                task = Task(
+                    f"{operation}_{file_name}_{ctx.file_header}.txt",
+                    _write_file,
+                    (ctx, count, operation, sort_operands, apply),
+                    is_chunked=True,
+                )
+                result.append(task)
+
+    return result
 
 
 def _remainder_near(
@@ -93,29 +70,37 @@ def _small_rem_big(big: Decimal, small: Decimal) -> tuple[Decimal, Decimal]:
 
 
 def _write_file(
-    dir: str,
+    path: str,
     ctx: Context,
-    decimals: list[Decimal],
+    count: int,
     operation: str,
-    file_name: str,
     sort_operands: Callable[[Decimal, Decimal], tuple[Decimal, Decimal]],
     apply: Callable[
         [decimal.Context, decimal.Decimal, decimal.Decimal], decimal.Decimal
     ],
+    chunk: Chunk,
 ):
-    file_name = f"{file_name}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
+    ctx = ctx.copy(rounding)
     ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
+    decimals = list(ctx.generate(count, seed=SEED))
+    lhs_indices = chunk.take(list(range(len(decimals))))
+    is_big_rem_small = sort_operands is _big_rem_small
+
+    with open_lines(path, ctx, operation, rounding) as lines:
+        for big, small in _generate_pairs(
+            ctx, lhs_indices, decimals, is_big_rem_small
+        ):
+            lhs, rhs = sort_operands(big, small)
+            is_lhs_finite = ctx_python.is_finite(lhs.value)
+            is_rhs_finite = ctx_python.is_finite(rhs.value)
+
+            # Division by zero, see the comment below.
+            if is_lhs_finite and is_rhs_finite and ctx_python.is_zero(rhs.value):
+                continue
 
-    with open(path, "w") as f:
-        for big, small in _generate_pairs(ctx, decimals):
             ctx.flags.clear_all()
-            lhs, rhs = sort_operands(big, small)
             result = apply(ctx_python, lhs.value, rhs.value)
 
             # https://speleotrove.com/decimal/daops.html#refremain
@@ -131,9 +116,9 @@ def _write_file(
             # Speleotrove: if the result of the division (quotient) is not representable
             #        in a given format (overflow) then 'nan' is returned  with
             #        'invalidOperation' flag raised.
-            is_lhs_finite = ctx_python.is_finite(lhs.value)
-            is_rhs_finite = ctx_python.is_finite(rhs.value)
-
+            #
+            # Most of those pairs are already removed by '_generate_pairs', but we
+            # still have the ones where the quotient is close to 10^precision.
             if is_lhs_finite and is_rhs_finite and ctx_python.is_nan(result):
                 continue
 
@@ -143,42 +128,73 @@ def _write_file(
                 # the 'precision' argument.
                 result = ctx_python.copy_sign(result, lhs.value)
 
-            excluded_flags: list[FlagType] = []
+            excluded_flags: FlagMask = 0
 
             if not is_lhs_finite or not is_rhs_finite:
-                excluded_flags.append(FLAG_INVALID_OPERATION)
+                excluded_flags |= MASK_INVALID_OPERATION
 
             if ctx_python.is_subnormal(result):
-                excluded_flags.append(FLAG_SUBNORMAL)
-
-            ctx.flags.assert_empty(excluding=excluded_flags)
-
-            write_line(
-                f,
-                context=ctx,
-                operation=operation,
-                rounding=rounding,
-                arguments=[lhs, rhs],
-                expected=Decimal(result),
-            )
-
+                excluded_flags |= MASK_SUBNORMAL
 
-def _generate_pairs(ctx: Context, decimals: list[Decimal]):
-    ctx_python = ctx._python_context
+            flags = ctx.flags.snapshot()
+            ctx.flags.assert_empty(excluding=excluded_flags, snapshot=flags)
 
-    for lhs in decimals:
-        lhs_mag = ctx_python.copy_abs(lhs.value)
-        is_lhs_finite = ctx_python.is_finite(lhs.value)
+            lines.append([lhs, rhs], Decimal(result), flags)
 
-        for rhs in decimals:
-            rhs_mag = ctx_python.copy_abs(rhs.value)
-            is_rhs_finite = ctx_python.is_finite(rhs.value)
 
-            if is_lhs_finite and is_rhs_finite:
-                cmp = ctx_python.compare(lhs_mag, rhs_mag)
-                is_lhs_less = ctx_python.is_signed(cmp)
-                pair = (rhs, lhs) if is_lhs_less else (lhs, rhs)
+def _generate_pairs(
+    ctx: Context,
+    lhs_indices: list[int],
+    decimals: list[Decimal],
+    is_big_rem_small: bool,
+) -> Iterator[tuple[Decimal, Decimal]]:
+    """
+    (big, small) pairs in the order of the 'lhs_indices x decimals' cartesian
+    product.
+
+    For 'big % small' the integer quotient has 'adjusted(big) - adjusted(small)'
+    (+1) digits, so if the difference is greater than precision then the result is
+    NaN. We skip those pairs by looking only at the operands with the adjusted
+    exponent close to the 'lhs'.
+    """
+    precision = ctx.precision
+    all_indices = list(range(len(decimals)))
+    is_finite = [d.value.is_finite() for d in decimals]
+    # Exact comparison, does not use the context.
+    magnitudes = [d.value.copy_abs() for d in decimals]
+
+    # Operands that are always included: zeros, infinities and NaNs.
+    other_indices: list[int] = []
+    # Finite non-zero operands by the adjusted exponent.
+    buckets: dict[int, list[int]] = {}
+
+    for index, d in enumerate(decimals):
+        if is_finite[index] and not d.value.is_zero():
+            buckets.setdefault(d.value.adjusted(), []).append(index)
+        else:
+            other_indices.append(index)
+
+    for lhs_index in lhs_indices:
+        lhs = decimals[lhs_index]
+        rhs_indices = all_indices
+
+        if is_big_rem_small and is_finite[lhs_index] and not lhs.value.is_zero():
+            adjusted = lhs.value.adjusted()
+            rhs_indices = list(other_indices)
+
+            for exponent in range(adjusted - precision, adjusted + precision + 1):
+                rhs_indices.extend(buckets.get(exponent, ()))
+
+            rhs_indices.sort()
+
+        is_lhs_finite = is_finite[lhs_index]
+        lhs_magnitude = magnitudes[lhs_index]
+
+        for rhs_index in rhs_indices:
+            rhs = decimals[rhs_index]
+
+            if is_lhs_finite and is_finite[rhs_index]:
+                is_lhs_less = lhs_magnitude < magnitudes[rhs_index]
+                yield (rhs, lhs) if is_lhs_less else (lhs, rhs)
             else:
-                pair = (lhs, rhs)
-
-            yield pair
+                yield (lhs, rhs)
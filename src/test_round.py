@@ -1,14 +1,16 @@
-import os
 from common import (
     DECIMALS,
     ROUNDINGS,
     ROUNDING_TO_ZERO,
-    FLAG_INEXACT,
-    FLAG_INVALID_OPERATION,
+    MASK_INEXACT,
+    MASK_INVALID_OPERATION,
     Context,
     Decimal,
-    FlagType,
-    write_line,
+    FlagMask,
+    Rounding,
+    Task,
+    apply_all_roundings,
+    open_fused_lines,
 )
 
 DECIMAL_COUNT = 80_000
@@ -21,93 +23,74 @@ SEEDS: tuple[int, ...] = (
 )
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
     for ctx in DECIMALS:
         for index, seed in enumerate(SEEDS):
-            decimals = ctx.generate(DECIMAL_COUNT, seed=seed)
-            _write_round_file(dir, ctx, index, decimals)
-            _write_round_exact_file(dir, ctx, index, decimals)
-
-
-def _write_round_file(
-    dir: str,
+            # All roundings (and 'round_exact') in a single pass over the operands.
+            file_names = [
+                f"round_{ctx.file_header}_{rounding.swift_name}_{index}.txt"
+                for rounding in ROUNDINGS
+            ]
+            file_names.append(f"round_exact_{ctx.file_header}_{index}.txt")
+
+            task = Task(
+                file_names[0],
+                _write_round_files,
+                (ctx, seed, ROUNDINGS),
+                fused_file_names=tuple(file_names[1:]),
+            )
+            result.append(task)
+
+    return result
+
+
+def _write_round_files(
+    paths: list[str],
     ctx: Context,
-    file_index: int,
-    decimals: list[Decimal],
+    seed: int,
+    roundings: tuple[Rounding, ...],
 ):
+    "'round' for every rounding, the last path is 'round_exact'."
     operation = "round"
-    ctx_python = ctx._python_context
-
-    for rounding in ROUNDINGS:
-        file_name = (
-            f"{operation}_{ctx.file_header}_{rounding.swift_name}_{file_index}.txt"
-        )
-        path = os.path.join(dir, file_name)
-        print(file_name)
-
-        # The most important line:
-        ctx_python.rounding = rounding.python
-
-        with open(path, "w") as f:
-            for d in decimals:
-                ctx.flags.clear_all()
-                result = ctx_python.to_integral_exact(d.value)
 
-                excluded_flags: list[FlagType] = [FLAG_INEXACT]
+    # The most important line:
+    contexts = [ctx.copy(rounding) for rounding in roundings]
+    files = [(c, operation, r) for c, r in zip(contexts, roundings)]
+    decimals = contexts[0].generate_iter(DECIMAL_COUNT, seed=seed)
 
-                if ctx_python.is_snan(d.value):
-                    excluded_flags.append(FLAG_INVALID_OPERATION)
+    # 'round_exact' is 'round' without the inexact results.
+    # Rounding does not matter (exact results are the same for every rounding).
+    exact_index = roundings.index(ROUNDING_TO_ZERO)
+    exact_ctx = contexts[exact_index]
+    files.append((exact_ctx, "round_exact", ROUNDING_TO_ZERO))
 
-                ctx.flags.assert_empty(excluding=excluded_flags)
+    with open_fused_lines(paths, files) as writers:
+        exact_lines = writers.pop()
 
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[d],
-                    expected=Decimal(result),
-                )
+        for d in decimals:
+            results = apply_all_roundings(contexts, lambda c: _round(c, d))
 
+            for lines, (result, flags) in zip(writers, results):
+                lines.append([d], result, flags)
 
-def _write_round_exact_file(
-    dir: str,
-    ctx: Context,
-    file_index: int,
-    decimals: list[Decimal],
-):
-    operation = "round_exact"
+            result, flags = results[exact_index]
+            if not flags & MASK_INEXACT:
+                exact_lines.append([d], result, flags)
 
-    file_name = f"{operation}_{ctx.file_header}_{file_index}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
 
-    # Rounding does not matter
-    rounding = ROUNDING_TO_ZERO
+def _round(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
     ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
-
-    with open(path, "w") as f:
-        for d in decimals:
-            ctx.flags.clear_all()
-            result = ctx_python.to_integral_exact(d.value)
-
-            excluded_flags: list[FlagType] = [FLAG_INEXACT]
+    ctx.flags.clear_all()
+    result = ctx_python.to_integral_exact(d.value)
 
-            if ctx_python.is_snan(d.value):
-                excluded_flags.append(FLAG_INVALID_OPERATION)
+    excluded_flags: FlagMask = MASK_INEXACT
 
-            ctx.flags.assert_empty(excluding=excluded_flags)
+    if ctx_python.is_snan(d.value):
+        excluded_flags |= MASK_INVALID_OPERATION
 
-            compare = ctx_python.compare(d.value, result)
-            is_exact = ctx_python.is_zero(compare)
+    flags = ctx.flags.snapshot()
+    ctx.flags.assert_empty(excluding=excluded_flags, snapshot=flags)
 
-            if not ctx.flags.is_set(FLAG_INEXACT):
-                write_line(
-                    f,
-                    context=ctx,
-                    operation=operation,
-                    rounding=rounding,
-                    arguments=[d],
-                    expected=Decimal(result),
-                )
+    return Decimal(result), flags
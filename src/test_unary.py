@@ -1,54 +1,85 @@
-import os
 import decimal
-from typing import Callable
 from common import (
     DECIMALS,
     ROUNDING_TO_ZERO,
-    FLAG_SUBNORMAL,
+    MASK_SUBNORMAL,
     Context,
     Decimal,
-    write_line,
+    FlagMask,
+    Task,
+    UnaryOperation,
+    check_oracle,
+    is_negative,
+    is_oracle_checked,
+    open_fused_lines,
+    with_sign,
 )
 
 SEED = 1984816
 DECIMAL_COUNT = 20_000
 
 
-def write(dir: str):
+def tasks() -> list[Task]:
+    result: list[Task] = []
+
+    # All of them are written in a single pass over the operands.
+    operations: tuple[UnaryOperation, ...] = (
+        ("plus", _plus, decimal.Context.copy_decimal),
+        ("minus", _minus, decimal.Context.copy_negate),
+        ("abs", _abs, decimal.Context.copy_abs),
+    )
+    names = [operation for operation, _, _ in operations]
+
     for ctx in DECIMALS:
-        ds = ctx.generate(DECIMAL_COUNT, seed=SEED)
-        _write_file(dir, ctx, ds, "plus", lambda ctx, d: ctx.copy_decimal(d))
-        _write_file(dir, ctx, ds, "minus", lambda ctx, d: ctx.copy_negate(d))
-        _write_file(dir, ctx, ds, "abs", lambda ctx, d: ctx.copy_abs(d))
+        file_names = [f"{name}_{ctx.file_header}.txt" for name in names]
+        task = Task(
+            file_names[0],
+            _write_files,
+            (ctx, operations),
+            fused_file_names=tuple(file_names[1:]),
+        )
+        result.append(task)
 
+    return result
 
-def _write_file(
-    dir: str,
+
+def _write_files(
+    paths: list[str],
     ctx: Context,
-    decimals: list[Decimal],
-    operation: str,
-    apply: Callable[[decimal.Context, decimal.Decimal], decimal.Decimal],
+    operations: tuple[UnaryOperation, ...],
 ):
-    file_name = f"{operation}_{ctx.file_header}.txt"
-    path = os.path.join(dir, file_name)
-    print(file_name)
-
     # Rounding does not matter
     rounding = ROUNDING_TO_ZERO
-    ctx_python = ctx._python_context
-    ctx_python.rounding = rounding.python
-
-    with open(path, "w") as f:
-        for d in decimals:
-            ctx.flags.clear_all()
-            result = apply(ctx_python, d.value)
-            ctx.flags.assert_empty(excluding=FLAG_SUBNORMAL)
-
-            write_line(
-                f,
-                context=ctx,
-                operation=operation,
-                rounding=rounding,
-                arguments=[d],
-                expected=Decimal(result),
-            )
+    ctx = ctx.copy(rounding)
+    decimals = ctx.generate_iter(DECIMAL_COUNT, seed=SEED)
+    names = [operation for operation, _, _ in operations]
+
+    files = [(ctx, name, rounding) for name in names]
+
+    with open_fused_lines(paths, files) as writers:
+        for index, d in enumerate(decimals):
+            is_checked = is_oracle_checked(ctx, index, index)
+
+            for (name, apply, oracle), lines in zip(operations, writers):
+                result, flags = apply(ctx, d)
+
+                if is_checked:
+                    message = f"{name}({d})"
+                    check_oracle(
+                        message, result, flags, ctx, oracle, d, excluding=MASK_SUBNORMAL
+                    )
+
+                lines.append([d], result, flags)
+
+
+# Copies do not signal.
+def _plus(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
+    return d, 0
+
+
+def _minus(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
+    return with_sign(d, not is_negative(d)), 0
+
+
+def _abs(ctx: Context, d: Decimal) -> tuple[Decimal, FlagMask]:
+    return with_sign(d, False), 0